@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage
+
+STATE_TTL = 15 * 60  # секунд, після яких незавершена автентифікація забувається
+MAX_RECORDS = 100000  # верхня межа кількості записів у пам'яті
+MAX_ATTEMPTS = 5  # невдалих спроб до тимчасового блокування
+LOCKOUT = 15 * 60  # секунд блокування після MAX_ATTEMPTS невдалих спроб
+
+
+# Стани автентифікації користувача
+class AuthStates(StatesGroup):
+    waiting_for_password = State()
+
+
+# FSM-сховище в пам'яті, записи якого видаляються через ttl секунд після
+# останньої зміни. Записи впорядковані за часом зміни, тож прострочені
+# завжди знаходяться на початку і видаляються за O(1) на кожну операцію.
+class TTLMemoryStorage(BaseStorage):
+    def __init__(self, ttl=STATE_TTL, max_records=MAX_RECORDS):
+        self.ttl = ttl
+        self.max_records = max_records
+        self._records = OrderedDict()  # key -> [state, data, expires_at]
+
+    def _evict(self, now):
+        while self._records:
+            key, record = next(iter(self._records.items()))
+            if record[2] > now and len(self._records) <= self.max_records:
+                break
+            del self._records[key]
+
+    def _get(self, key):
+        now = time.monotonic()
+        self._evict(now)
+        record = self._records.get(key)
+        if record is not None and record[2] <= now:
+            del self._records[key]
+            return None
+        return record
+
+    def _put(self, key, state, data):
+        if state is None and not data:
+            self._records.pop(key, None)
+            return
+        self._records[key] = [state, data, time.monotonic() + self.ttl]
+        self._records.move_to_end(key)
+        self._evict(time.monotonic())
+
+    async def set_state(self, key, state=None):
+        record = self._get(key)
+        data = record[1] if record else {}
+        self._put(key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        record = self._get(key)
+        return record[0] if record else None
+
+    async def set_data(self, key, data):
+        record = self._get(key)
+        state = record[0] if record else None
+        self._put(key, state, dict(data))
+
+    async def get_data(self, key):
+        record = self._get(key)
+        return dict(record[1]) if record else {}
+
+    async def close(self):
+        self._records.clear()
+
+
+# Вибір сховища станів: Redis-сумісний сервер (Redis, Valkey, KeyDB тощо),
+# якщо задано redis_url, інакше — пам'ять процесу
+def create_storage(redis_url=None):
+    if redis_url:
+        # Пакет redis (з requirements.txt) імпортується лише за потреби
+        from aiogram.fsm.storage.redis import RedisStorage
+        return RedisStorage.from_url(redis_url, state_ttl=STATE_TTL, data_ttl=STATE_TTL)
+    return TTLMemoryStorage()
+
+
+# Перевірка, чи користувача тимчасово заблоковано після невдалих спроб.
+# Повертає кількість секунд до розблокування або 0.
+def lockout_remaining(data):
+    return max(0, int(data.get("locked_until", 0) - time.time()))
+
+
+# Облік невдалої спроби; повертає оновлені дані стану
+def register_failure(data):
+    attempts = data.get("attempts", 0) + 1
+    if attempts >= MAX_ATTEMPTS:
+        return {"attempts": 0, "locked_until": time.time() + LOCKOUT}
+    return {"attempts": attempts}
@@ -0,0 +1,377 @@
+# Навантажувальний тест розсилок бота на локальних замінниках:
+# фейковий Telegram Bot API (з лімітами 429 та заблокованими користувачами 403),
+# фейковий Pixabay із заданою затримкою та локальна база користувачів.
+#
+# Запуск:
+#     python benchmark.py --users 10000 --paths daily,text,photo
+#     python benchmark.py --users 100000 --telegram-rate 300 --bot-rate 250 --output bench_output.txt
+#     python benchmark.py --database-url postgresql://localhost/bench   # замість SQLite
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+import aiohttp
+from aiohttp import web
+
+BENCH_TOKEN = "123456:BENCHMARK"
+ADMIN_ID = 1
+
+
+# ---------- Фейкові сервери (працюють в окремому процесі) ----------
+
+class FakeTelegram:
+    def __init__(self, rate, latency, blocked_every):
+        self.rate = rate
+        self.latency = latency
+        self.blocked_every = blocked_every
+        self._window = deque()  # час відправок за останню секунду
+        self._last_by_chat = {}
+        self._message_id = 0
+
+    def _message(self, chat_id, **fields):
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields,
+        }
+
+    def _error(self, status, description, **parameters):
+        payload = {"ok": False, "error_code": status, "description": description}
+        if parameters:
+            payload["parameters"] = parameters
+        return web.json_response(payload, status=status)
+
+    # Перевірка лімітів Telegram: ~rate повідомлень/с загалом і 1/с в один чат
+    def _limited(self, chat_id):
+        now = time.monotonic()
+        while self._window and now - self._window[0] > 1:
+            self._window.popleft()
+        if len(self._window) >= self.rate:
+            return True
+        if now - self._last_by_chat.get(chat_id, -1.0) < 1:
+            return True
+        self._window.append(now)
+        self._last_by_chat[chat_id] = now
+        return False
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "bench"}})
+        if method not in ("sendMessage", "sendPhoto", "copyMessage", "copyMessages"):
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(data["chat_id"])
+        if self._limited(chat_id):
+            return self._error(429, "Too Many Requests: retry after 1", retry_after=1)
+        if chat_id != ADMIN_ID and self.blocked_every and chat_id % self.blocked_every == 0:
+            return self._error(403, "Forbidden: bot was blocked by the user")
+
+        if method == "sendPhoto":
+            photo = data["photo"]
+            file_id = photo if isinstance(photo, str) else f"uploaded-{self._message_id}"
+            size = {"file_unique_id": file_id, "width": 640, "height": 480}
+            result = self._message(chat_id, photo=[{"file_id": file_id, **size}])
+        elif method == "sendMessage":
+            result = self._message(chat_id, text=data.get("text", ""))
+        elif method == "copyMessages":
+            result = [{"message_id": self._message_id + i} for i in range(len(json.loads(data["message_ids"])))]
+        else:
+            result = {"message_id": self._message_id}
+        return web.json_response({"ok": True, "result": result})
+
+
+class FakePixabay:
+    def __init__(self, latency, base_url):
+        self.latency = latency
+        self.base_url = base_url
+
+    async def search(self, request):
+        await asyncio.sleep(self.latency)
+        page = int(request.query.get("page", 1))
+        per_page = int(request.query.get("per_page", 20))
+        hits = [
+            {"id": page * 1000 + i, "webformatURL": f"{self.base_url}/img/{page * 1000 + i}.jpg"}
+            for i in range(per_page)
+        ]
+        return web.json_response({"totalHits": 500, "hits": hits})
+
+    async def image(self, request):
+        await asyncio.sleep(self.latency)
+        return web.Response(body=b"\xff\xd8\xff" + os.urandom(32 * 1024), content_type="image/jpeg")
+
+
+def run_fake_servers(port, telegram_rate, telegram_latency, pixabay_latency, blocked_every):
+    telegram = FakeTelegram(telegram_rate, telegram_latency, blocked_every)
+    pixabay = FakePixabay(pixabay_latency, f"http://127.0.0.1:{port}")
+    app = web.Application(client_max_size=50 * 1024 * 1024)
+    app.router.add_post("/bot{token}/{method}", telegram.handle)
+    app.router.add_get("/api/", pixabay.search)
+    app.router.add_get("/img/{name}", pixabay.image)
+    app.router.add_get("/health", lambda request: web.Response(text="ok"))
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+async def wait_for_server(url):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Фейковий сервер {url} не запустився")
+
+
+# ---------- Локальна база користувачів ----------
+
+def seed_sqlite(path, users):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, user_id INTEGER UNIQUE, username TEXT, first_name TEXT)")
+    conn.executemany(
+        "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+        ((user_id, f"user{user_id}", f"Користувач {user_id}") for user_id in range(ADMIN_ID, ADMIN_ID + users)),
+    )
+    conn.commit()
+    conn.close()
+
+
+# Заміна функцій читання користувачів з db.py на читання з SQLite
+def use_sqlite_users(db, path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+
+    def page(after_user_id, limit):
+        return conn.execute(
+            "SELECT user_id, username, first_name FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (after_user_id, limit),
+        ).fetchall()
+
+    async def get_users_page(after_user_id, limit, shard=None, active_only=False):
+        return await asyncio.to_thread(page, after_user_id, limit)
+
+    db.get_users_page = get_users_page
+
+
+async def seed_postgres(db, database_url, users):
+    await db.init_db(database_url, ssl=None)
+    await db.execute('''
+        INSERT INTO users (user_id, username, first_name)
+        SELECT g, 'user' || g, 'Користувач ' || g FROM generate_series($1::bigint, $2::bigint) AS g
+        ON CONFLICT (user_id) DO NOTHING
+    ''', ADMIN_ID, ADMIN_ID + users - 1)
+
+
+# ---------- Вимірювання ----------
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class SendRecorder:
+    SEND_METHODS = {"SendMessage", "SendPhoto", "CopyMessage", "CopyMessages"}
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = []
+        self.sent = 0
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        if name not in self.SEND_METHODS or getattr(method, "chat_id", None) == ADMIN_ID:
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+            self.sent += 1
+            return response
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+async def monitor_loop_lag(samples, interval=0.01):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - started - interval)
+
+
+async def measure(name, run, recorder):
+    recorder.reset()
+    lag = []
+    monitor = asyncio.create_task(monitor_loop_lag(lag))
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        await run()
+    finally:
+        duration = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        monitor.cancel()
+    return {
+        "path": name,
+        "sent": recorder.sent,
+        "duration": duration,
+        "rate": recorder.sent / duration if duration else 0.0,
+        "p50": percentile(recorder.latencies, 0.5) * 1000,
+        "p99": percentile(recorder.latencies, 0.99) * 1000,
+        "peak_mb": peak / 1024 / 1024,
+        "lag_p99": percentile(lag, 0.99) * 1000,
+        "lag_max": max(lag, default=0.0) * 1000,
+    }
+
+
+def format_report(args, rows):
+    lines = [
+        f"Користувачів: {args.users}, ліміт Telegram: {args.telegram_rate}/с, "
+        f"заблоковано: кожен {args.blocked_every}-й, затримка Pixabay: {args.pixabay_latency * 1000:.0f} мс",
+        f"{'шлях':<8} {'надіслано':>9} {'час, с':>8} {'повід./с':>9} {'p50, мс':>8} {'p99, мс':>8} "
+        f"{'пам., МБ':>9} {'lag p99':>8} {'lag max':>8}",
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['path']:<8} {row['sent']:>9} {row['duration']:>8.1f} {row['rate']:>9.1f} {row['p50']:>8.1f} "
+            f"{row['p99']:>8.1f} {row['peak_mb']:>9.1f} {row['lag_p99']:>8.1f} {row['lag_max']:>8.1f}"
+        )
+    lines.append(f"Пікова пам'ять процесу (RSS): {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ")
+    return "\n".join(lines)
+
+
+# ---------- Запуск ----------
+
+async def run_benchmark(args, workdir):
+    base_url = f"http://127.0.0.1:{args.port}"
+    await wait_for_server(f"{base_url}/health")
+
+    os.environ.update({
+        "BOT_TOKEN": BENCH_TOKEN,
+        "BOT_PASSWORD": "benchmark",
+        "PIXABAY_API_KEY": "benchmark",
+        "PIXABAY_API_URL": f"{base_url}/api/",
+        "TELEGRAM_API_URL": base_url,
+        "DATABASE_URL": args.database_url or "postgresql://unused",
+    })
+    if not args.database_url:
+        os.environ["OUTBOX_SQLITE_PATH"] = os.path.join(workdir, "outbox.db")
+
+    import broadcast
+    import db
+    from aiogram.types import Message
+
+    # Обмежувач замінюється до імпорту бота, який використовує його в розсилках.
+    # Власний темп щоденної розсилки в бенчмарку не нижчий за ліміт бота.
+    if args.bot_rate:
+        broadcast.global_limiter = broadcast.TokenBucket(args.bot_rate)
+    os.environ.setdefault("DELIVERY_RATE", str(args.bot_rate or broadcast.GLOBAL_RATE))
+    import bot as bot_module
+
+    bot_module.ADMIN_USER_IDS.append(ADMIN_ID)
+
+    if args.database_url:
+        await seed_postgres(db, args.database_url, args.users)
+        # Колонки слотів доставки та ротації контенту, як в on_startup бота
+        await bot_module.delivery_planner.init()
+        await bot_module.content_rotation.init()
+    else:
+        users_path = os.path.join(workdir, "users.db")
+        seed_sqlite(users_path, args.users)
+        use_sqlite_users(db, users_path)
+        bot_module.media_cache.persist = False
+        bot_module.content_rotation.persist = False
+        bot_module.outbox.on_checkpoint = None  # стан доставки зберігається лише в PostgreSQL
+
+    recorder = SendRecorder()
+    bot_module.bot.session.middleware(recorder)
+    await bot_module.image_pool.start([bot_module.DAILY_IMAGE_QUERY, bot_module.NEW_PHOTO_QUERY])
+    await bot_module.media_cache.start()
+    await bot_module.outbox.init()
+
+    def admin_message(**fields):
+        return Message.model_validate({
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": ADMIN_ID, "type": "private"},
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "admin"},
+            **fields,
+        }).as_(bot_module.bot)
+
+    photo = [{"file_id": "bench-photo", "file_unique_id": "bench-photo", "width": 640, "height": 480}]
+    paths = {
+        "daily": bot_module.send_random_messages,
+        "text": lambda: bot_module.broadcast_handler(admin_message(text="/t Бенчмарк")),
+        "photo": lambda: bot_module.broadcast_handler(admin_message(photo=photo, caption="/t Бенчмарк")),
+    }
+
+    rows = []
+    try:
+        for name in args.paths.split(","):
+            rows.append(await measure(name, paths[name], recorder))
+    finally:
+        await bot_module.outbox.close()
+        await bot_module.media_cache.close()
+        await bot_module.image_pool.close()
+        await bot_module.bot.session.close()
+        if args.database_url:
+            await db.close_db()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Навантажувальний тест розсилок бота")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--paths", default="daily,text,photo", help="daily, text, photo через кому")
+    parser.add_argument("--telegram-rate", type=int, default=30, help="ліміт фейкового Telegram, повід./с")
+    parser.add_argument("--telegram-latency", type=float, default=0.03, help="затримка фейкового Telegram, с")
+    parser.add_argument("--pixabay-latency", type=float, default=0.2, help="затримка фейкового Pixabay, с")
+    parser.add_argument("--blocked-every", type=int, default=20, help="кожен N-й користувач заблокував бота")
+    parser.add_argument("--bot-rate", type=float, default=None, help="глобальний ліміт розсилки бота, повід./с")
+    parser.add_argument("--database-url", default=None, help="локальний PostgreSQL замість SQLite")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--output", default=None, help="файл для збереження звіту")
+    args = parser.parse_args()
+
+    server = multiprocessing.get_context("fork").Process(
+        target=run_fake_servers,
+        args=(args.port, args.telegram_rate, args.telegram_latency, args.pixabay_latency, args.blocked_every),
+        daemon=True,
+    )
+    server.start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            rows = asyncio.run(run_benchmark(args, workdir))
+    finally:
+        server.terminate()
+        server.join()
+
+    report = format_report(args, rows)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+
+
+if __name__ == "__main__":
+    main()
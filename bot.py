@@ -1,25 +1,74 @@
 import asyncio
+import hmac
 import logging
-import random
 import os
-import requests
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from collections import OrderedDict
 from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
 from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
 from aiogram.types import Message
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import BufferedInputFile, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram import Router
+from datetime import datetime, time
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from pytz import timezone
+from pytz import timezone, UnknownTimeZoneError
 from dotenv import load_dotenv
 
+import auth
+import broadcast
+import cluster
+import db
+import health
+import images
+import media
+import metrics
+import planner
+import progress
+import reactions
+import rotation
+import users_io
+from outbox import Outbox, PostgresOutboxStore, SQLiteOutboxStore
+import webhook
+
 # Завантаження змінних середовища
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
 PIXABAY_API_KEY = os.getenv("PIXABAY_API_KEY")
+PIXABAY_API_URL = os.getenv("PIXABAY_API_URL", images.PIXABAY_API_URL)
 DATABASE_URL = os.getenv("DATABASE_URL")
+BOT_PASSWORD = os.getenv("BOT_PASSWORD")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")  # необов'язково: власний Bot API сервер
+REDIS_URL = os.getenv("REDIS_URL")  # необов'язково: сховище станів автентифікації
+OUTBOX_SQLITE_PATH = os.getenv("OUTBOX_SQLITE_PATH")  # лише для локального тестування
+
+# Режим роботи: "polling" (за замовчуванням) або "webhook".
+# Procfile запускає лише процес worker (polling). Для режиму webhook на Heroku
+# замініть його на `web: BOT_MODE=webhook python bot.py`. Обидва процеси
+# разом запускати не можна: worker видаляє вебхук, який встановлює web.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # публічна адреса, напр. https://example.herokuapp.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("PORT", "8080"))
+# Кількість процесів вебхука. Не WEB_CONCURRENCY: Heroku задає її сам.
+WEB_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+SHUTDOWN_TIMEOUT = 25  # секунд на всю зупинку: Heroku завершує процес через 30 с після SIGTERM
+SHUTDOWN_CLOSE_RESERVE = 5  # з них секунд на запис реакцій і закриття з'єднань
+METRICS_PORT = os.getenv("METRICS_PORT")  # у режимі polling: порт для /metrics
+
+# Кілька реплік: щоденна розсилка захоплюється через таблицю job_runs,
+# а при DELIVERY_SHARDS > 1 кожна репліка надсилає лише свою частину користувачів
+DELIVERY_SHARDS = int(os.getenv("DELIVERY_SHARDS", "1"))
+
+# Вікно щоденної розсилки: користувачі розподіляються по ньому рівномірно
+DELIVERY_WINDOW_START = os.getenv("DELIVERY_WINDOW_START", "18:00")
+DELIVERY_WINDOW_MINUTES = int(os.getenv("DELIVERY_WINDOW_MINUTES", str(planner.WINDOW_MINUTES)))
+DELIVERY_RATE = float(os.getenv("DELIVERY_RATE", str(planner.DELIVERY_RATE)))  # повідомлень/с
 
 if not TOKEN:
     raise ValueError("❌ Токен не знайдено! Перевірте файл .env.")
@@ -27,138 +76,172 @@ if not PIXABAY_API_KEY:
     raise ValueError("❌ API-ключ Pixabay не знайдено! Перевірте файл .env.")
 if not DATABASE_URL:
     raise ValueError("❌ URL бази даних не знайдено! Перевірте файл .env.")
+if not BOT_PASSWORD:
+    raise ValueError("❌ Пароль бота не знайдено! Перевірте файл .env.")
+if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+    raise ValueError("❌ Для режиму webhook потрібен WEBHOOK_SECRET! Перевірте файл .env.")
+# Процеси не мають спільної пам'яті: без Redis /start і пароль можуть
+# потрапити в різні процеси. Частини альбому /t однаково зберігаються лише
+# в пам'яті процесу, тож альбом може розділитися між процесами.
+if BOT_MODE == "webhook" and WEB_WORKERS > 1 and not REDIS_URL:
+    raise ValueError("❌ Для WEBHOOK_WORKERS > 1 потрібен REDIS_URL! Перевірте файл .env.")
 
 # Налаштування логування
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Ініціалізація бота і диспетчера
-bot = Bot(token=TOKEN)
-dp = Dispatcher()
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=TOKEN, session=session)
+dp = Dispatcher(storage=auth.create_storage(REDIS_URL))
 
 # Ініціалізація Router
 router = Router()
 dp.include_router(router)
 
+# Збір метрик обробників і запитів до Telegram
+for observer in (dp.message, dp.callback_query, router.message, router.callback_query):
+    observer.middleware(metrics.HandlerMetricsMiddleware())
+bot.session.middleware(metrics.TelegramRequestMetricsMiddleware())
+
 # Часовий пояс Києва
 kyiv_tz = timezone("Europe/Kyiv")
 
 # Список Telegram user_id для отримання повідомлень від бота
 ADMIN_USER_IDS = [471637263, 646146668]  # Замініть на список реальних user_id
 
-# Підключення до бази даних PostgreSQL
-conn = psycopg2.connect(DATABASE_URL, sslmode="require")
-cursor = conn.cursor(cursor_factory=RealDictCursor)
-
-# Створення таблиці користувачів
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        id SERIAL PRIMARY KEY,
-        user_id BIGINT UNIQUE NOT NULL,
-        username TEXT,
-        first_name TEXT
-    )
-''')
-conn.commit()
-
-# Функція для створення клавіатури з кнопками
-def create_reaction_keyboard():
+# Теми зображень для щоденної розсилки та для кнопки 🔄
+DAILY_IMAGE_QUERY = "motivation"
+NEW_PHOTO_QUERY = "mountains, sunset, flowers, love"
+
+# Скільки різних зображень використовується в одній щоденній розсилці
+# (кожне завантажується в Telegram лише один раз)
+DAILY_IMAGES_PER_BROADCAST = 5
+
+# Пул зображень з Pixabay, що поповнюється у фоні
+image_pool = images.ImagePool(PIXABAY_API_KEY, api_url=PIXABAY_API_URL)
+
+# Набір зображень щоденної розсилки на сьогодні: дата -> зображення
+daily_image_sets = {}
+
+# Кеш file_id завантажених у Telegram зображень
+media_cache = media.MediaCache()
+
+# Черга розсилок з фіксацією прогресу (PostgreSQL або SQLite для тестів)
+outbox = Outbox(
+    SQLiteOutboxStore(OUTBOX_SQLITE_PATH) if OUTBOX_SQLITE_PATH else PostgresOutboxStore(),
+    owner=cluster.replica_id(),
+    on_checkpoint=health.record_results,  # стан доставки користувачів
+)
+
+# Планувальник доставки щоденної розсилки (слот для кожного користувача)
+delivery_planner = planner.DeliveryPlanner(
+    kyiv_tz,
+    window_start=time.fromisoformat(DELIVERY_WINDOW_START),
+    window_minutes=DELIVERY_WINDOW_MINUTES,
+    rate=DELIVERY_RATE,
+)
+
+# Буфер реакцій, що записується в базу пакетами
+reaction_pipeline = reactions.ReactionPipeline()
+
+# Кількість учасників на одній сторінці /get_users
+USERS_PAGE_SIZE = 30
+
+# Потоковий перебір user_id усіх активних користувачів (крім exclude) або однієї частини (shard)
+async def iter_user_ids(exclude=None, shard=None):
+    async for user in db.iter_users(shard=shard, active_only=True):
+        if user['user_id'] != exclude:
+            yield user['user_id']
+
+# Функція для створення клавіатури з кнопками.
+# У callback_data передаються id зображення Pixabay та номер підпису для статистики реакцій.
+def create_reaction_keyboard(image_id=None, caption_id=None):
+    suffix = f":{image_id if image_id is not None else ''}:{caption_id if caption_id is not None else ''}"
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
-            InlineKeyboardButton(text="❤️", callback_data="reaction:like"),
-            InlineKeyboardButton(text="🔄", callback_data="reaction:new_photo"),
+            InlineKeyboardButton(text="❤️", callback_data=f"reaction:{reactions.LIKE}{suffix}"),
+            InlineKeyboardButton(text="🔄", callback_data=f"reaction:{reactions.NEW_PHOTO}{suffix}"),
         ]
     ])
     return keyboard
 
-# Функція для додавання користувача до бази даних
-def add_user(user_id, username, first_name):
-    try:
-        cursor.execute('''
-            INSERT INTO users (user_id, username, first_name)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (user_id) DO NOTHING
-        ''', (user_id, username, first_name))
-        conn.commit()
-        logging.info(f"Користувач {user_id} доданий до бази даних.")
-    except Exception as e:
-        conn.rollback()  # Скасовуємо транзакцію у разі помилки
-        logging.error(f"Помилка при додаванні користувача {user_id}: {e}")
-
-# Функція для видалення користувача з бази даних
-def remove_user(user_id):
-    try:
-        cursor.execute('DELETE FROM users WHERE user_id = %s', (user_id,))
-        conn.commit()
-        logging.info(f"Користувач {user_id} видалений із бази даних.")
-    except Exception as e:
-        conn.rollback()  # Скасовуємо транзакцію у разі помилки
-        logging.error(f"Помилка при видаленні користувача {user_id}: {e}")
-
-# Функція для отримання всіх користувачів з бази даних
-def get_all_users():
-    try:
-        cursor.execute('SELECT user_id, username, first_name FROM users')
-        return cursor.fetchall()
-    except Exception as e:
-        conn.rollback()  # Скасовуємо транзакцію у разі помилки
-        logging.error(f"Помилка при отриманні списку користувачів: {e}")
-        return []
-
-# Функція для отримання випадкового зображення за темою
-def get_random_image(query="mountains, flowers, love"):
-    url = f"https://pixabay.com/api/?key={PIXABAY_API_KEY}&q={query}&image_type=photo&per_page=50"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        if data["hits"]:
-            return random.choice(data["hits"])["webformatURL"]
-    return None
-
 # Обробник команди /start
 @router.message(Command("start"))
-async def start_handler(message: Message):  # Використовуємо правильний імпортований клас
-    user_id = message.from_user.id
-    username = message.from_user.username
-    first_name = message.from_user.first_name
+async def start_handler(message: Message, state: FSMContext):
+    data = await state.get_data()
+    remaining = auth.lockout_remaining(data)
+    if remaining:
+        await message.answer(f"⛔ Забагато невдалих спроб. Спробуйте через {remaining // 60 + 1} хв.")
+        return
 
+    await state.set_state(auth.AuthStates.waiting_for_password)
     await message.answer("🔒 Введіть пароль для доступу до бота:")
 
-    @router.message()  # Вкладений хендлер — це погана практика, потрібно винести окремо
-    async def password_handler(password_message: Message):
-        entered_password = password_message.text
-        correct_password = os.getenv("BOT_PASSWORD")  
-
-        if entered_password == correct_password:
-            add_user(user_id, username, first_name)
-
-            await password_message.answer(f"✅ Пароль правильний! Привіт, {first_name}! Ти додана у список розсилки.")
-            logging.info(f"✅ Користувач {user_id} ({username}) доданий у список розсилки.")
+# Обробник пароля (лише для користувачів, які надіслали /start)
+@router.message(auth.AuthStates.waiting_for_password)
+async def password_handler(message: Message, state: FSMContext):
+    user_id = message.from_user.id
+    username = message.from_user.username
+    first_name = message.from_user.first_name
 
-            new_user_text = (
-                f"🆕 Новий користувач!\n"
-                f"👤 Ім'я: {first_name}\n"
-                f"🆔 ID: {user_id}\n"
-                f"🔗 @{username if username else 'немає'}"
-            )
-            for admin_id in ADMIN_USER_IDS:
-                try:
-                    await password_message.bot.send_message(admin_id, new_user_text)
-                except Exception as e:
-                    logging.warning(f"⚠️ Не вдалося повідомити адміна {admin_id}: {e}")
+    if message.text and hmac.compare_digest(message.text.encode(), BOT_PASSWORD.encode()):
+        await state.clear()
+        await db.add_user(user_id, username, first_name)
+        await health.reactivate(user_id)
+        await delivery_planner.assign(user_id)
+
+        await message.answer(f"✅ Пароль правильний! Привіт, {first_name}! Ти додана у список розсилки.")
+        logging.info(f"✅ Користувач {user_id} ({username}) доданий у список розсилки.")
+
+        new_user_text = (
+            f"🆕 Новий користувач!\n"
+            f"👤 Ім'я: {first_name}\n"
+            f"🆔 ID: {user_id}\n"
+            f"🔗 @{username if username else 'немає'}"
+        )
+        for admin_id in ADMIN_USER_IDS:
+            try:
+                await message.bot.send_message(admin_id, new_user_text)
+            except Exception as e:
+                logging.warning(f"⚠️ Не вдалося повідомити адміна {admin_id}: {e}")
 
+    else:
+        data = auth.register_failure(await state.get_data())
+        await state.set_data(data)
+        if auth.lockout_remaining(data):
+            await state.set_state(None)
+            await message.answer("⛔ Забагато невдалих спроб. Доступ тимчасово заблоковано.")
         else:
-            await password_message.answer("❌ Неправильний пароль. Доступ заборонено.")
-            logging.warning(f"❌ Невдала спроба доступу користувача {user_id} ({username}).")
+            await message.answer("❌ Неправильний пароль. Доступ заборонено.")
+        logging.warning(f"❌ Невдала спроба доступу користувача {user_id} ({username}).")
 
 # Обробник команди /sendnow для миттєвої розсилки
 @dp.message(Command("sendnow"))
 async def send_now_handler(message: types.Message):
     if message.from_user.id in ADMIN_USER_IDS:  # Перевіряємо, чи це адміністратор
-        await send_random_messages()
+        result = await send_random_messages()
+        await message.answer(f"📬 Розсилку завершено.\n{result.summary()}")
     else:
         await message.answer("❌ У вас немає прав для виконання цієї команди.")
 
-# Обробник команди /t для розсилки тексту або фото всім користувачам, крім відправника
+# Альбоми, надіслані адміністраторами: media_group_id -> id повідомлень.
+# Telegram надсилає кожен елемент альбому окремим оновленням.
+ALBUM_WAIT = 1.5  # секунд на отримання решти елементів альбому
+MAX_ALBUMS = 100
+album_messages = OrderedDict()
+
+def remember_album_message(message):
+    message_ids = album_messages.setdefault(message.media_group_id, [])
+    if message.message_id not in message_ids:
+        message_ids.append(message.message_id)
+    album_messages.move_to_end(message.media_group_id)
+    while len(album_messages) > MAX_ALBUMS:
+        album_messages.popitem(last=False)
+
+# Обробник команди /t для розсилки будь-якого повідомлення всім користувачам, крім відправника:
+# /t <текст>, медіа (фото, відео, документ, голосове, альбом) з підписом /t
+# або /t у відповідь на повідомлення, яке треба розіслати без змін.
+# Медіа копіюються на сервері Telegram (copy_message), без повторного завантаження.
 @dp.message(Command("t"))
 async def broadcast_handler(message: types.Message):
     if message.from_user.id not in ADMIN_USER_IDS:
@@ -166,68 +249,213 @@ async def broadcast_handler(message: types.Message):
         return
 
     try:
-        users = get_all_users()
-
-        if not users:
+        if not await db.get_users_page(-2 ** 63, 1, active_only=True):
             await message.answer("❌ Немає користувачів для розсилки.")
             return
 
-        # **Обробка фото**
-        if message.photo:
-            photo_id = message.photo[-1].file_id  # Отримуємо фото у найкращій якості
-            
-            # Видаляємо текст команди `/t` з підпису, якщо він є
-            caption = message.caption if message.caption else ""
-            caption = caption.replace("/t", "").strip()  # Видаляємо команду та зайві пробіли
+        source = message.reply_to_message
+        if source is not None:
+            # Повідомлення (або весь альбом), на яке відповіли командою, копіюється як є
+            if source.media_group_id and source.media_group_id in album_messages:
+                message_ids = sorted(album_messages[source.media_group_id])
+            else:
+                message_ids = [source.message_id]
+            kind, payload = "copy", {"from_chat_id": source.chat.id, "message_ids": message_ids}
+        elif message.text:
+            text_content = message.text[len("/t"):].strip()  # Видаляємо "/t" і зайві пробіли
+            if not text_content:
+                await message.answer("❌ Ви не написали текст для розсилки!")
+                return
+            kind, payload = "text", {"text": text_content}
+        elif message.media_group_id:
+            # Альбом з підписом /t: чекаємо решту елементів. Підписи альбому
+            # не копіюються, тож текст після /t надсилається окремим повідомленням.
+            remember_album_message(message)
+            await asyncio.sleep(ALBUM_WAIT)
+            message_ids = sorted(album_messages[message.media_group_id])
+            caption = (message.caption or "").replace("/t", "", 1).strip()
+            kind, payload = "copy", {
+                "from_chat_id": message.chat.id,
+                "message_ids": message_ids,
+                "remove_caption": True,
+                "text": caption or None,
+            }
+        else:
+            # Видаляємо текст команди `/t` з підпису
+            caption = (message.caption or "").replace("/t", "", 1).strip()
+            kind, payload = "copy", {"from_chat_id": message.chat.id, "message_ids": [message.message_id], "caption": caption}
+
+        # Усі користувачі, крім відправника
+        broadcast_id = await outbox.submit(kind, payload, iter_user_ids(exclude=message.from_user.id))
+        status = progress.BroadcastProgress(bot, message.chat.id, broadcast_id, await outbox.total(broadcast_id))
+        await status.start()
+        result = None
+        try:
+            result = await outbox.run(broadcast_id, kind, payload, on_result=status.on_result)
+        finally:
+            await status.finish(result)  # зупиняє оновлення прогресу навіть після помилки
 
-            for user in users:
-                if user['user_id'] == message.from_user.id:
-                    continue  # Пропускаємо відправника
+    except Exception as e:
+        await message.answer(f"❌ Помилка при розсилці: {e}")
 
-                try:
-                    await bot.send_photo(chat_id=user['user_id'], photo=photo_id, caption=caption or None)
-                    logging.info(f"📨 Фото надіслано користувачу {user['user_id']}")
-                except Exception as e:
-                    logging.warning(f"⚠️ Не вдалося надіслати фото користувачу {user['user_id']}: {e}")
+# Запам'ятовування елементів альбомів від адміністраторів (для /t)
+@dp.message(lambda message: message.media_group_id is not None and message.from_user.id in ADMIN_USER_IDS)
+async def album_handler(message: types.Message):
+    remember_album_message(message)
 
-            await message.answer("✅ Фото успішно розіслано всім користувачам!")
-            return  # ВАЖЛИВО! ВИХОДИМО З ФУНКЦІЇ, ЩОБ НЕ ОБРОБЛЯТИ ТЕКСТ
+# Обробник кнопки скасування розсилки
+@router.callback_query(lambda callback: callback.data.startswith(progress.CANCEL_PREFIX))
+async def cancel_broadcast_handler(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMIN_USER_IDS:
+        await callback.answer("❌ У вас немає прав для виконання цієї команди.")
+        return
 
-        # **Обробка тексту (якщо фото немає)**
-        text_content = message.text[len("/t"):].strip()  # Видаляємо "/t" і зайві пробіли
+    broadcast_id = int(callback.data[len(progress.CANCEL_PREFIX):])
+    if await outbox.cancel(broadcast_id):
+        await callback.answer("⛔ Розсилку скасовано.")
+    else:
+        await callback.answer("❌ Розсилка вже завершена.")
 
-        if not text_content:
-            await message.answer("❌ Ви не написали текст для розсилки!")
-            return
+# Обробник команди /outbox для перегляду прогресу останніх розсилок
+@dp.message(Command("outbox"))
+async def outbox_handler(message: types.Message):
+    if message.from_user.id in ADMIN_USER_IDS:  # Перевіряємо, чи це адміністратор
+        report = await outbox.report()
+        if report:
+            await message.answer(f"📬 Останні розсилки:\n{report}")
+        else:
+            await message.answer("❌ Розсилок ще не було.")
+    else:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
 
-        for user in users:
-            if user['user_id'] == message.from_user.id:
-                continue  # Пропускаємо відправника
+# Формування сторінки списку учасників з кнопками навігації.
+# Кнопки містять user_id першого/останнього користувача на сторінці (keyset-курсор).
+async def build_users_page(after_user_id=None, before_user_id=None):
+    if before_user_id is not None:
+        users = await db.get_users_page_before(before_user_id, USERS_PAGE_SIZE + 1)
+        has_prev = len(users) > USERS_PAGE_SIZE
+        users = users[-USERS_PAGE_SIZE:]
+        has_next = True
+    else:
+        users = await db.get_users_page(after_user_id if after_user_id is not None else -2 ** 63, USERS_PAGE_SIZE + 1)
+        has_next = len(users) > USERS_PAGE_SIZE
+        users = users[:USERS_PAGE_SIZE]
+        has_prev = after_user_id is not None
+
+    if not users:
+        return None, None
+
+    user_list = "\n".join([f"ID: {user['user_id']}, Ім'я: {user['first_name']}, Нікнейм: @{user['username'] if user['username'] else 'немає'}" for user in users])
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton(text="⬅️", callback_data=f"users:prev:{users[0]['user_id']}"))
+    if has_next:
+        buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"users:next:{users[-1]['user_id']}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return f"📋 Список учасників:\n{user_list}", keyboard
+
+# Обробник команди /stats для перегляду метрик бота
+@dp.message(Command("stats"))
+async def stats_handler(message: types.Message):
+    if message.from_user.id in ADMIN_USER_IDS:  # Перевіряємо, чи це адміністратор
+        await message.answer(metrics.summary())
+    else:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
 
-            try:
-                await bot.send_message(user['user_id'], text_content)
-                logging.info(f"📨 Повідомлення надіслано користувачу {user['user_id']}")
-            except Exception as e:
-                logging.warning(f"⚠️ Не вдалося надіслати повідомлення користувачу {user['user_id']}: {e}")
+# Обробник команди /time для вибору власного часу щоденної розсилки:
+# /time 08:30 [Europe/Kyiv] або /time off для повернення до загального вікна
+@dp.message(Command("time"))
+async def time_handler(message: types.Message):
+    user_id = message.from_user.id
+    if not await db.get_user(user_id):
+        await message.answer("❌ Спершу приєднайтеся до розсилки командою /start.")
+        return
 
-        await message.answer("✅ Повідомлення успішно розіслано всім користувачам!")
+    command_parts = message.text.split()
+    if len(command_parts) < 2:
+        await message.answer("❌ Неправильний формат. Використовуйте: /time 08:30 [Europe/Kyiv] або /time off")
+        return
 
+    try:
+        if command_parts[1] == "off":
+            await delivery_planner.set_preference(user_id)
+            await message.answer("✅ Розсилка надходитиме у загальний час.")
+            return
+        delivery_time = time.fromisoformat(command_parts[1])
+        user_timezone = command_parts[2] if len(command_parts) > 2 else None
+        await delivery_planner.set_preference(user_id, delivery_time, user_timezone)
+        await message.answer(
+            f"✅ Розсилка надходитиме о {delivery_time.strftime('%H:%M')} ({user_timezone or kyiv_tz.zone})."
+        )
+    except ValueError:
+        await message.answer("❌ Неправильний формат часу. Використовуйте ГГ:ХХ, наприклад 08:30.")
+    except UnknownTimeZoneError:
+        await message.answer("❌ Невідомий часовий пояс. Приклад: Europe/Kyiv")
     except Exception as e:
-        await message.answer(f"❌ Помилка при розсилці: {e}")
+        logging.error(f"Помилка при збереженні часу розсилки для {user_id}: {e}")
+        await message.answer("❌ Не вдалося зберегти час розсилки. Спробуйте пізніше.")
+
+# Обробник команди /health для перегляду стану доставки та вимкнених користувачів
+@dp.message(Command("health"))
+async def health_handler(message: types.Message):
+    if message.from_user.id in ADMIN_USER_IDS:  # Перевіряємо, чи це адміністратор
+        await message.answer(await health.report())
+    else:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
+
+# Обробник команди /reactions: найпопулярніші зображення та підписи (зі зведеної таблиці)
+@dp.message(Command("reactions"))
+async def reactions_handler(message: types.Message):
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
+        return
+
+    images_top = await reaction_pipeline.top("image")
+    captions_top = await reaction_pipeline.top("caption")
+    if not images_top and not captions_top:
+        await message.answer("❌ Реакцій ще немає.")
+        return
+
+    lines = ["🖼 Зображення:"]
+    for row in images_top:
+        lines.append(f"❤️ {row['likes']} 🔄 {row['refreshes']} — https://pixabay.com/photos/id-{row['key']}/")
+    lines.append("\n💬 Підписи:")
+    for row in captions_top:
+        caption = MESSAGES[row['key']] if row['key'] < len(MESSAGES) else f"#{row['key']}"
+        lines.append(f"❤️ {row['likes']} 🔄 {row['refreshes']} — {caption}")
+    await message.answer("\n".join(lines), disable_web_page_preview=True)
 
 # Обробник команди /get_users для отримання списку учасників
 @dp.message(Command("get_users"))
 async def get_users_handler(message: types.Message):
     if message.from_user.id in ADMIN_USER_IDS:  # Перевіряємо, чи це адміністратор
-        users = get_all_users()
-        if users:
-            user_list = "\n".join([f"ID: {user['user_id']}, Ім'я: {user['first_name']}, Нікнейм: @{user['username'] if user['username'] else 'немає'}" for user in users])
-            await message.answer(f"📋 Список учасників:\n{user_list}")
+        text, keyboard = await build_users_page()
+        if text:
+            await message.answer(text, reply_markup=keyboard)
         else:
             await message.answer("❌ Список учасників порожній.")
     else:
         await message.answer("❌ У вас немає прав для виконання цієї команди.")
 
+# Обробник кнопок навігації списку учасників
+@router.callback_query(lambda callback: callback.data.startswith("users:"))
+async def users_page_handler(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMIN_USER_IDS:
+        await callback.answer("❌ У вас немає прав для виконання цієї команди.")
+        return
+
+    _, direction, cursor = callback.data.split(":")
+    if direction == "next":
+        text, keyboard = await build_users_page(after_user_id=int(cursor))
+    else:
+        text, keyboard = await build_users_page(before_user_id=int(cursor))
+
+    if text:
+        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.answer()
+    else:
+        await callback.answer("❌ Більше учасників немає.")
+
 # Обробник команди /add_user для ручного додавання користувача
 @dp.message(Command("add_user"))
 async def add_user_handler(message: types.Message):
@@ -243,8 +471,7 @@ async def add_user_handler(message: types.Message):
             user_id = int(command_parts[1])
 
             # Перевіряємо, чи користувач вже існує
-            cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
-            existing_user = cursor.fetchone()
+            existing_user = await db.get_user(user_id)
             if existing_user:
                 await message.answer(f"❌ Користувач із ID {user_id} вже існує в базі даних.")
                 return
@@ -259,7 +486,8 @@ async def add_user_handler(message: types.Message):
                 return
 
             # Додаємо користувача до бази даних
-            add_user(user_id, username, first_name)
+            await db.add_user(user_id, username, first_name)
+            await delivery_planner.assign(user_id)
             await message.answer(f"✅ Користувач доданий:\nID: {user_id}\nІм'я: {first_name}\nНікнейм: @{username}")
         except ValueError:
             await message.answer("❌ Неправильний формат. user_id має бути числом.")
@@ -268,6 +496,62 @@ async def add_user_handler(message: types.Message):
     else:
         await message.answer("❌ У вас немає прав для виконання цієї команди.")
 
+# Обробник команди /import_users для масового додавання користувачів.
+# CSV або JSON-файл надсилається з командою в підписі або командою у відповідь на файл.
+@dp.message(Command("import_users"))
+async def import_users_handler(message: types.Message):
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
+        return
+
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    if not document:
+        await message.answer(
+            "❌ Надішліть CSV або JSON-файл з підписом /import_users або дайте цією командою відповідь на файл.\n"
+            "Формат CSV: user_id,username,first_name (username і first_name необов'язкові)."
+        )
+        return
+    if document.file_size and document.file_size > users_io.MAX_FILE_SIZE:
+        await message.answer(f"❌ Файл завеликий (максимум {users_io.MAX_FILE_SIZE // 1024 // 1024} МБ).")
+        return
+
+    try:
+        data = await bot.download(document)
+        rows = users_io.parse(data.read(), document.file_name or "")
+    except (ValueError, UnicodeDecodeError) as e:
+        await message.answer(f"❌ Не вдалося прочитати файл: {e}")
+        return
+
+    await message.answer(f"⏳ Імпортую {len(rows)} рядків...")
+    try:
+        added = await users_io.import_users(bot, rows)
+        await delivery_planner.assign_many(added)
+    except Exception as e:
+        logging.error(f"Помилка при імпорті користувачів: {e}")
+        await message.answer(f"❌ Помилка при імпорті користувачів: {e}")
+        return
+    await message.answer_document(
+        BufferedInputFile(users_io.report(rows), filename="import_report.csv"),
+        caption=users_io.summary(rows),
+    )
+
+# Обробник команди /export_users для вивантаження списку користувачів у CSV
+@dp.message(Command("export_users"))
+async def export_users_handler(message: types.Message):
+    if message.from_user.id not in ADMIN_USER_IDS:
+        await message.answer("❌ У вас немає прав для виконання цієї команди.")
+        return
+
+    try:
+        path, count = await users_io.export_users()
+    except Exception as e:
+        await message.answer(f"❌ Помилка при експорті користувачів: {e}")
+        return
+    try:
+        await message.answer_document(FSInputFile(path, filename="users.csv"), caption=f"📤 Користувачів: {count}")
+    finally:
+        os.remove(path)
+
 # Обробник команди /remove_user для ручного видалення користувача
 @dp.message(Command("remove_user"))
 async def remove_user_handler(message: types.Message):
@@ -283,14 +567,13 @@ async def remove_user_handler(message: types.Message):
             user_id = int(command_parts[1])
 
             # Перевіряємо, чи користувач існує
-            cursor.execute('SELECT * FROM users WHERE user_id = %s', (user_id,))
-            existing_user = cursor.fetchone()
+            existing_user = await db.get_user(user_id)
             if not existing_user:
                 await message.answer(f"❌ Користувача з ID {user_id} не знайдено в базі даних.")
                 return
 
             # Видаляємо користувача
-            remove_user(user_id)
+            await db.remove_user(user_id)
             await message.answer(f"✅ Користувач із ID {user_id} успішно видалений.")
         except ValueError:
             await message.answer("❌ Неправильний формат. user_id має бути числом.")
@@ -302,128 +585,350 @@ async def remove_user_handler(message: types.Message):
 # Обробник кнопок реакції
 @router.callback_query(lambda callback: callback.data.startswith("reaction:"))
 async def reaction_handler(callback: types.CallbackQuery):
-    if callback.data == "reaction:like":
+    # reaction:<тип>[:<id зображення>:<номер підпису>] (старі кнопки — без id)
+    kind, image_id, caption_id = (callback.data.split(":")[1:] + ["", ""])[:3]
+    if kind in (reactions.LIKE, reactions.NEW_PHOTO):
+        reaction_pipeline.record(
+            callback.from_user.id,
+            kind,
+            int(image_id) if image_id else None,
+            int(caption_id) if caption_id else None,
+        )
+
+    if kind == reactions.LIKE:
         await callback.answer("❤️ Дякую за твою реакцію!")
         logging.info(f"Користувач {callback.from_user.id} натиснув ❤️")
-    elif callback.data == "reaction:new_photo":
+    elif kind == reactions.NEW_PHOTO:
         await callback.answer("🔄 Завантажую нове фото...")
         logging.info(f"Користувач {callback.from_user.id} запросив нове фото")
 
         # Завантажуємо нове фото
-        image = get_random_image(query="mountains, sunset, flowers, love")
+        image = image_pool.draw(NEW_PHOTO_QUERY)
         if image:
-            await bot.send_photo(
+            await media_cache.send_photo(
+                bot,
                 callback.from_user.id,
-                photo=image,
+                image["url"],
                 caption="Ось нове фото для вас!",
-                reply_markup=create_reaction_keyboard()
+                reply_markup=create_reaction_keyboard(image["id"])
             )
         else:
             await callback.message.answer("⚠️ Не вдалося отримати нове фото.")
 
-# Функція для розсилки випадкових приємних повідомлень
-async def send_random_messages():
-    messages = [
-        "Ти чудова!", "Не забувай посміхатися!", "В тебе все вийде!", "Ти особлива!", "Новий день – нові можливості! Лови їх!", 
-        "Ти сильніша, ніж думаєш. Усе вийде!", "Сьогодні твій день – зроби його крутим!", "Прокидайся! У світу для тебе є щось особливе!", 
-        "Сонце вже світить для тебе – час підкорювати світ!", "Зроби сьогодні те, про що завтра подякуєш собі!",  
-        "Твоя енергія – твоя суперсила! Використай її!", "Кожен новий ранок – це шанс почати спочатку!", "Не бійся труднощів – вони роблять тебе сильнішою!", 
-        "Сьогодні ти на крок ближче до своєї мрії!", "Дихай глибше, усміхайся ширше – вперед до успіху!", "Світ чекає на твої звершення!", 
-        "Будь собою – це вже твоя суперсила!", "Кава, заряд позитиву і вперед до перемог!", "Щасливий день починається з усмішки!", 
-        "Не відкладай щастя – створюй його вже сьогодні!",  
-        "Роби те, що приносить тобі радість!", "Твої старання обов’язково принесуть плоди!", "Маленькі кроки ведуть до великих перемог!", 
-        "Зараз – найкращий час, щоб почати діяти!", "Навіть найтемніший ранок може стати яскравим!", "Відпусти сумніви – вперед до звершень!", 
-        "Живи цей день так, щоб увечері сказати: 'Я молодець!'", "Ти заслуговуєш на щасливе і насичене життя!", 
-        "Дивись на світ з оптимізмом – він відповість тобі тим самим!", "Кожна твоя дія – це крок до успіху!",  
-        "Розправ крила і лети до своєї мрії!", "Ти можеш досягти всього, що задумано!", "Новий день – нові можливості. Вперед!", 
-        "Ти неймовірна!", "Вір у себе – ти здатна на більше!", "Ти здолаєш будь-які труднощі!", "Ніколи не здавайся!", 
-        "Кожен день – це новий шанс!", "У тебе є все, щоб досягти мети!", "Продовжуй рухатися вперед, ти на правильному шляху!",  
-        "Твоя рішучість – твій ключ до успіху!", "Життя дарує тобі безліч можливостей, скористайся ними!", "Не бійся мріяти – мрії здійснюються!", 
-        "Ти сильна, навіть коли не відчуваєш це!", "Ти здатна подолати будь-які перешкоди!", "У тебе є все, щоб досягти великих висот!", 
-        "Вір у свої сили, і все буде добре!", "Завжди пам’ятай, що ти варта більше!", "Продовжуй розвиватися – кожен крок вперед важливий!", 
-        "Ти вже на шляху до великої мети!",  
-        "Немає нічого неможливого для того, хто вірить!", "Кожен день – це шанс стати кращою!", "Твоя стійкість захоплює!", 
-        "У тебе є все, щоб змінити своє життя на краще!", "Сьогоднішній день – це новий початок!", "Ти не одна – ми всі тут, щоб підтримати тебе!", 
-        "Не бійся бути іншою, ти вже унікальна!", "Всі великі досягнення починаються з маленьких кроків!", "Ти – приклад для наслідування!", 
-        "Твоя рішучість і сила волі неймовірні!",  
-        "Пам’ятай, що ти – невід’ємна частина цього світу!", "Ти вже зробила перший крок, тепер іди далі!", "Підкорюй свої мрії та амбіції!", 
-        "Сміливо йди вперед, світ чекає на тебе!", "Ти все здолаєш!", "У тебе є сила зробити цей день особливим!", 
-        "Що б не сталося, пам’ятай: ти завжди маєш можливість змінити ситуацію!", "Твоя енергія не має меж!", 
-        "Завжди пам’ятай про свою цінність!", "Ти маєш силу змінювати світ на краще!",  
-        "Ти справжня героїня у власній історії!", "Сьогодні буде ще один чудовий день!", 
-        "Твоя рішучість допоможе тобі подолати будь-які труднощі!", "Ти маєш внутрішню силу, яка допоможе подолати все!", 
-        "Ти заслуговуєш на всі найкращі речі в житті!", "Ти – натхнення для багатьох!", "Не бійся змін, вони приводять до великого!", 
-        "Твоя ціль зовсім близько, тримайся!", "Ти сильніша, ніж ти думаєш!", "Будь впевнена у собі – ти справжня лідерка!",  
-        "У тебе є все для того, щоб створити своє щастя!", "Ти – унікальна, не забувай про це!", "Життя не має меж, і твої можливості – теж!", 
-        "Сьогодні саме той день, щоб розпочати новий шлях!", "Ти – чудова, продовжуй працювати над собою!", "Вір у себе, і ти побачиш чудеса!", 
-        "Твоя праця обов’язково принесе плоди!", "Не забувай, що ти сильніша за будь-які обставини!", "Твоя енергія може змінити цей світ!", 
-        "Ти вже на півшляху до своєї мети!",  
-        "У тебе є все для того, щоб бути щасливою!", "Ти народжена для великих справ!", "Кожен крок наближає тебе до мрії!", 
-        "Твоя рішучість і віра в себе безцінні!", "Ти справжня борчиня – продовжуй боротися!", "Всі великі досягнення починаються з маленьких кроків!", 
-        "Ти здатна на більше, ніж ти думаєш!", "Не бійся труднощів – вони роблять тебе сильнішою!", "Не забувай, що ти здатна змінити світ!", 
-        "Ти вже зробила найважчий крок – дій!",  
-        "Ти можеш зробити все, що забажаєш!", "Твоя віра в себе – це твоя сила!", "Будь відважною, мрії здійснюються!", 
-        "Ти здатна досягти будь-якої вершини!", "Не дозволяй сумнівам зупиняти тебе!", "Кожен день – це шанс стати кращою!", 
-        "Ти володієш безмежною енергією!", "У тебе є все для того, щоб здійснити свої мрії!", "Ти здатна підкорити будь-які вершини!",
-        "Життя дарує безліч шансів – скористайся ними!", "Перемога починається з віри в себе!", "Новий день принесе нові можливості!", 
-        "Сміливо крокуй вперед, успіх уже чекає!", "У кожній трудності прихована сила для росту!", "Розкривай свої можливості – світ належить сміливим!", 
-        "Твоя енергія здатна змінити світ!", "Кожен момент вартий того, щоб його пережити!", "Сміх і позитив – найкращий початок дня!", 
-        "Усі мрії можуть стати реальністю!", "Сьогодні – саме той день для змін!", "Нехай серце веде до перемог!", 
-        "Крок за кроком ти будеш наближатися до мети!", "Вір у свої сили – це твій головний секрет!", "Життя готове подарувати чудеса, треба тільки вірити!", 
-        "Твоя впертість дарує великі можливості!", "Сьогоднішній день – це шанс для початку нового!", "Вітаю з новими можливостями!", 
-        "Всі великі досягнення починаються з маленьких кроків!", "Світ чекає на твої досягнення!", "Немає нічого неможливого для того, хто вірить!", 
-        "Розпочни цей день із великого плану!", "Не зупиняйся, бо попереду нові горизонти!", "Перемога завжди на стороні сміливих!", 
-        "Дихай глибше і насолоджуйся кожним моментом!", "Твоя впертість дає сили для великих звершень!", "Кожен день – новий шанс для розвитку!", 
-        "Змініть все, що не приносить щастя!", "Життя відкриває перед тобою великі можливості!", "Сміливо вирушай на зустріч до своїх мрій!", 
-        "Всі труднощі тимчасові, а твої можливості – безмежні!", "Вір у те, що ти можеш і обов’язково досягнеш мети!", "Сьогодні твій день, лови всі можливості!", 
-        "Мрії здійснюються, якщо в них вірити і діяти!", "Не бійтеся робити помилки – вони ведуть до росту!", "Ти здатна на більше, ніж думаєш!", 
-        "Сміливість відкриває двері до нових досягнень!", "Робити кроки вперед – це вже перемога!", "У кожній складній ситуації прихована можливість для росту!", 
-        "Ніколи не сумнівайся в своїх силах!", "Ти сильна, навіть коли не відчуваєш це!", "Твоя рішучість зробить цей день особливим!", 
-        "Будь впевнена в собі – це перший крок до успіху!", "Твоя віра в себе – це твоє найсильніше зброя!", 
-        "Не бійтеся бути собою – це ваш шлях до справжньої сили!", "Відкривай серце для нових можливостей!", "Роби те, що любиш, і будеш щасливою!",
-        "Працюй над собою, і все прийде в потрібний час!", "Зараз і є найкращий час для змін!", "Життя не чекає, тому крокуй вперед прямо зараз!", 
-        "Твоя впертість і відвага відкривають нові горизонти!", "Не зупиняйся, якщо є хоч один шанс зробити більше!", 
-        "Твій шлях до успіху починається з маленького кроку!", "Не чекай на ідеальний момент – створюй його!", 
-        "Робити перший крок завжди найважче, але він того вартий!", "Ніколи не здавайся – досягнеш своєї мети!", "Усі труднощі можна подолати, якщо йти до кінця!", 
-        "Сьогоднішній день – це новий шанс!", "Сміливо йди вперед, попереду – великі досягнення!", "Ніколи не бійся великих мрій!", "Твоя рішучість – це твоя сила!", 
-        "Твоя сила і впертість приносять великі плоди!", "Сьогоднішній день – це шанс розпочати нову подорож!", "Не бійтеся змін, вони ведуть до кращого!", 
-        "Ти вже на півшляху до своєї мети!", "Життя – це подорож, а не мета!", "Іноді треба просто почати діяти, щоб побачити результат!", 
-        "Твоя сила волі – це твій ключ до всього!", "Не сумнівайся в своїх силах – ти можеш все!", "Твій шлях до успіху ще попереду!", 
-        "Сьогодні буде ще один чудовий день!", "Твоя рішучість допоможе подолати будь-які труднощі!", "Успіх приходить до тих, хто не боїться працювати!", 
-        "Кожен крок до мети – це вже перемога!", "Не бійся складних шляхів, вони ведуть до великих звершень!", "Вір у себе, і всі труднощі зникнуть!", 
-        "Твоя енергія здатна змінити будь-яку ситуацію!", "Що б не сталося, твоя сила не згасне!", "Не забувай, що твоя рішучість – це твоя суперсила!", 
-        "Ти справжня героїня у власній історії!", "Сміливо йди вперед, світ чекає на тебе!", "Не бійтеся помилок, вони допомагають рости!", 
-        "Ти можеш більше, ніж ти думаєш!", "Твоя рішучість і енергія вже ведуть до перемоги!", "Не бійтеся змін – вони завжди ведуть до кращого!", 
-        "Твоя рішучість та віра в себе створюють чудеса!", "У тебе є все для того, щоб зробити цей день чудовим!", 
-        "Твоя впертість і сміливість роблять тебе незламною!", "Не бійтеся змін, вони допомагають рости!", "Твоя віра в себе – це сила для великих досягнень!", 
-        "Життя дарує можливості, треба вірити в них!", "Твоя енергія може змінити цей світ!", "Кожен твій день – це шанс стати кращою версією себе!", 
-        "Світ чекає на твої досягнення!", "Немає меж для тих, хто вірить в себе!"
-    ]
-    for user in get_all_users():
+# Приємні повідомлення для щоденної розсилки
+MESSAGES = (
+    "Ти чудова!", "Не забувай посміхатися!", "В тебе все вийде!", "Ти особлива!", "Новий день – нові можливості! Лови їх!", 
+    "Ти сильніша, ніж думаєш. Усе вийде!", "Сьогодні твій день – зроби його крутим!", "Прокидайся! У світу для тебе є щось особливе!", 
+    "Сонце вже світить для тебе – час підкорювати світ!", "Зроби сьогодні те, про що завтра подякуєш собі!",  
+    "Твоя енергія – твоя суперсила! Використай її!", "Кожен новий ранок – це шанс почати спочатку!", "Не бійся труднощів – вони роблять тебе сильнішою!", 
+    "Сьогодні ти на крок ближче до своєї мрії!", "Дихай глибше, усміхайся ширше – вперед до успіху!", "Світ чекає на твої звершення!", 
+    "Будь собою – це вже твоя суперсила!", "Кава, заряд позитиву і вперед до перемог!", "Щасливий день починається з усмішки!", 
+    "Не відкладай щастя – створюй його вже сьогодні!",  
+    "Роби те, що приносить тобі радість!", "Твої старання обов’язково принесуть плоди!", "Маленькі кроки ведуть до великих перемог!", 
+    "Зараз – найкращий час, щоб почати діяти!", "Навіть найтемніший ранок може стати яскравим!", "Відпусти сумніви – вперед до звершень!", 
+    "Живи цей день так, щоб увечері сказати: 'Я молодець!'", "Ти заслуговуєш на щасливе і насичене життя!", 
+    "Дивись на світ з оптимізмом – він відповість тобі тим самим!", "Кожна твоя дія – це крок до успіху!",  
+    "Розправ крила і лети до своєї мрії!", "Ти можеш досягти всього, що задумано!", "Новий день – нові можливості. Вперед!", 
+    "Ти неймовірна!", "Вір у себе – ти здатна на більше!", "Ти здолаєш будь-які труднощі!", "Ніколи не здавайся!", 
+    "Кожен день – це новий шанс!", "У тебе є все, щоб досягти мети!", "Продовжуй рухатися вперед, ти на правильному шляху!",  
+    "Твоя рішучість – твій ключ до успіху!", "Життя дарує тобі безліч можливостей, скористайся ними!", "Не бійся мріяти – мрії здійснюються!", 
+    "Ти сильна, навіть коли не відчуваєш це!", "Ти здатна подолати будь-які перешкоди!", "У тебе є все, щоб досягти великих висот!", 
+    "Вір у свої сили, і все буде добре!", "Завжди пам’ятай, що ти варта більше!", "Продовжуй розвиватися – кожен крок вперед важливий!", 
+    "Ти вже на шляху до великої мети!",  
+    "Немає нічого неможливого для того, хто вірить!", "Кожен день – це шанс стати кращою!", "Твоя стійкість захоплює!", 
+    "У тебе є все, щоб змінити своє життя на краще!", "Сьогоднішній день – це новий початок!", "Ти не одна – ми всі тут, щоб підтримати тебе!", 
+    "Не бійся бути іншою, ти вже унікальна!", "Всі великі досягнення починаються з маленьких кроків!", "Ти – приклад для наслідування!", 
+    "Твоя рішучість і сила волі неймовірні!",  
+    "Пам’ятай, що ти – невід’ємна частина цього світу!", "Ти вже зробила перший крок, тепер іди далі!", "Підкорюй свої мрії та амбіції!", 
+    "Сміливо йди вперед, світ чекає на тебе!", "Ти все здолаєш!", "У тебе є сила зробити цей день особливим!", 
+    "Що б не сталося, пам’ятай: ти завжди маєш можливість змінити ситуацію!", "Твоя енергія не має меж!", 
+    "Завжди пам’ятай про свою цінність!", "Ти маєш силу змінювати світ на краще!",  
+    "Ти справжня героїня у власній історії!", "Сьогодні буде ще один чудовий день!", 
+    "Твоя рішучість допоможе тобі подолати будь-які труднощі!", "Ти маєш внутрішню силу, яка допоможе подолати все!", 
+    "Ти заслуговуєш на всі найкращі речі в житті!", "Ти – натхнення для багатьох!", "Не бійся змін, вони приводять до великого!", 
+    "Твоя ціль зовсім близько, тримайся!", "Ти сильніша, ніж ти думаєш!", "Будь впевнена у собі – ти справжня лідерка!",  
+    "У тебе є все для того, щоб створити своє щастя!", "Ти – унікальна, не забувай про це!", "Життя не має меж, і твої можливості – теж!", 
+    "Сьогодні саме той день, щоб розпочати новий шлях!", "Ти – чудова, продовжуй працювати над собою!", "Вір у себе, і ти побачиш чудеса!", 
+    "Твоя праця обов’язково принесе плоди!", "Не забувай, що ти сильніша за будь-які обставини!", "Твоя енергія може змінити цей світ!", 
+    "Ти вже на півшляху до своєї мети!",  
+    "У тебе є все для того, щоб бути щасливою!", "Ти народжена для великих справ!", "Кожен крок наближає тебе до мрії!", 
+    "Твоя рішучість і віра в себе безцінні!", "Ти справжня борчиня – продовжуй боротися!", "Всі великі досягнення починаються з маленьких кроків!", 
+    "Ти здатна на більше, ніж ти думаєш!", "Не бійся труднощів – вони роблять тебе сильнішою!", "Не забувай, що ти здатна змінити світ!", 
+    "Ти вже зробила найважчий крок – дій!",  
+    "Ти можеш зробити все, що забажаєш!", "Твоя віра в себе – це твоя сила!", "Будь відважною, мрії здійснюються!", 
+    "Ти здатна досягти будь-якої вершини!", "Не дозволяй сумнівам зупиняти тебе!", "Кожен день – це шанс стати кращою!", 
+    "Ти володієш безмежною енергією!", "У тебе є все для того, щоб здійснити свої мрії!", "Ти здатна підкорити будь-які вершини!",
+    "Життя дарує безліч шансів – скористайся ними!", "Перемога починається з віри в себе!", "Новий день принесе нові можливості!", 
+    "Сміливо крокуй вперед, успіх уже чекає!", "У кожній трудності прихована сила для росту!", "Розкривай свої можливості – світ належить сміливим!", 
+    "Твоя енергія здатна змінити світ!", "Кожен момент вартий того, щоб його пережити!", "Сміх і позитив – найкращий початок дня!", 
+    "Усі мрії можуть стати реальністю!", "Сьогодні – саме той день для змін!", "Нехай серце веде до перемог!", 
+    "Крок за кроком ти будеш наближатися до мети!", "Вір у свої сили – це твій головний секрет!", "Життя готове подарувати чудеса, треба тільки вірити!", 
+    "Твоя впертість дарує великі можливості!", "Сьогоднішній день – це шанс для початку нового!", "Вітаю з новими можливостями!", 
+    "Всі великі досягнення починаються з маленьких кроків!", "Світ чекає на твої досягнення!", "Немає нічого неможливого для того, хто вірить!", 
+    "Розпочни цей день із великого плану!", "Не зупиняйся, бо попереду нові горизонти!", "Перемога завжди на стороні сміливих!", 
+    "Дихай глибше і насолоджуйся кожним моментом!", "Твоя впертість дає сили для великих звершень!", "Кожен день – новий шанс для розвитку!", 
+    "Змініть все, що не приносить щастя!", "Життя відкриває перед тобою великі можливості!", "Сміливо вирушай на зустріч до своїх мрій!", 
+    "Всі труднощі тимчасові, а твої можливості – безмежні!", "Вір у те, що ти можеш і обов’язково досягнеш мети!", "Сьогодні твій день, лови всі можливості!", 
+    "Мрії здійснюються, якщо в них вірити і діяти!", "Не бійтеся робити помилки – вони ведуть до росту!", "Ти здатна на більше, ніж думаєш!", 
+    "Сміливість відкриває двері до нових досягнень!", "Робити кроки вперед – це вже перемога!", "У кожній складній ситуації прихована можливість для росту!", 
+    "Ніколи не сумнівайся в своїх силах!", "Ти сильна, навіть коли не відчуваєш це!", "Твоя рішучість зробить цей день особливим!", 
+    "Будь впевнена в собі – це перший крок до успіху!", "Твоя віра в себе – це твоє найсильніше зброя!", 
+    "Не бійтеся бути собою – це ваш шлях до справжньої сили!", "Відкривай серце для нових можливостей!", "Роби те, що любиш, і будеш щасливою!",
+    "Працюй над собою, і все прийде в потрібний час!", "Зараз і є найкращий час для змін!", "Життя не чекає, тому крокуй вперед прямо зараз!", 
+    "Твоя впертість і відвага відкривають нові горизонти!", "Не зупиняйся, якщо є хоч один шанс зробити більше!", 
+    "Твій шлях до успіху починається з маленького кроку!", "Не чекай на ідеальний момент – створюй його!", 
+    "Робити перший крок завжди найважче, але він того вартий!", "Ніколи не здавайся – досягнеш своєї мети!", "Усі труднощі можна подолати, якщо йти до кінця!", 
+    "Сьогоднішній день – це новий шанс!", "Сміливо йди вперед, попереду – великі досягнення!", "Ніколи не бійся великих мрій!", "Твоя рішучість – це твоя сила!", 
+    "Твоя сила і впертість приносять великі плоди!", "Сьогоднішній день – це шанс розпочати нову подорож!", "Не бійтеся змін, вони ведуть до кращого!", 
+    "Ти вже на півшляху до своєї мети!", "Життя – це подорож, а не мета!", "Іноді треба просто почати діяти, щоб побачити результат!", 
+    "Твоя сила волі – це твій ключ до всього!", "Не сумнівайся в своїх силах – ти можеш все!", "Твій шлях до успіху ще попереду!", 
+    "Сьогодні буде ще один чудовий день!", "Твоя рішучість допоможе подолати будь-які труднощі!", "Успіх приходить до тих, хто не боїться працювати!", 
+    "Кожен крок до мети – це вже перемога!", "Не бійся складних шляхів, вони ведуть до великих звершень!", "Вір у себе, і всі труднощі зникнуть!", 
+    "Твоя енергія здатна змінити будь-яку ситуацію!", "Що б не сталося, твоя сила не згасне!", "Не забувай, що твоя рішучість – це твоя суперсила!", 
+    "Ти справжня героїня у власній історії!", "Сміливо йди вперед, світ чекає на тебе!", "Не бійтеся помилок, вони допомагають рости!", 
+    "Ти можеш більше, ніж ти думаєш!", "Твоя рішучість і енергія вже ведуть до перемоги!", "Не бійтеся змін – вони завжди ведуть до кращого!", 
+    "Твоя рішучість та віра в себе створюють чудеса!", "У тебе є все для того, щоб зробити цей день чудовим!", 
+    "Твоя впертість і сміливість роблять тебе незламною!", "Не бійтеся змін, вони допомагають рости!", "Твоя віра в себе – це сила для великих досягнень!", 
+    "Життя дарує можливості, треба вірити в них!", "Твоя енергія може змінити цей світ!", "Кожен твій день – це шанс стати кращою версією себе!", 
+    "Світ чекає на твої досягнення!", "Немає меж для тих, хто вірить в себе!"
+)
+
+# Каталог підписів і ротація контенту без повторів для кожного користувача
+captions = rotation.Catalog(MESSAGES)
+content_rotation = rotation.ContentRotation(captions)
+
+# Функції, що відтворюють відправку для кожного типу розсилки з її збережених
+# параметрів — завдяки цьому розсилку можна продовжити після перезапуску
+def make_daily_send(payload):
+    # Розсилки, створені до появи id зображень, містять лише посилання
+    images = [{"id": None, "url": image} if isinstance(image, str) else image for image in payload["images"]]
+    # Вибір для отримувачів, яким надсилання буде повторено: ротація
+    # просувається один раз на отримувача, а не на кожну спробу
+    retrying = {}
+
+    async def send(chat_id):
+        if not images:
+            raise RuntimeError("Не вдалося отримати зображення з Pixabay.")
+        caption_id, image = retrying.pop(chat_id, None) or await content_rotation.next(chat_id, images)
         try:
-            message = random.choice(messages)
-            image = get_random_image(query="motivation")
-            if image:
-                await bot.send_photo(
-                    user['user_id'],
-                    photo=image,
-                    caption=message,
-                    reply_markup=create_reaction_keyboard()
-                )
-                logging.info(f"📨 Повідомлення з картинкою надіслано {user['user_id']}")
-            else:
-                logging.warning("⚠️ Не вдалося отримати зображення з Pixabay.")
-        except Exception as e:
-            logging.warning(f"⚠️ Не вдалося надіслати {user['user_id']}: {e}")
+            await media_cache.send_photo(
+                bot,
+                chat_id,
+                image["url"],
+                caption=captions[caption_id],
+                reply_markup=create_reaction_keyboard(image["id"], caption_id)
+            )
+        except (TelegramRetryAfter, *broadcast.TRANSIENT_ERRORS):
+            retrying[chat_id] = (caption_id, image)
+            raise
+    return send
+
+def make_text_send(payload):
+    async def send(chat_id):
+        await bot.send_message(chat_id, payload["text"])
+    return send
+
+def make_copy_send(payload):
+    copied = set()  # чати, куди альбом уже скопійовано, а текст ще ні (щоб повтор не дублював альбом)
+
+    async def send(chat_id):
+        if len(payload["message_ids"]) == 1:
+            await bot.copy_message(
+                chat_id, payload["from_chat_id"], payload["message_ids"][0], caption=payload.get("caption")
+            )
+            return
+        if chat_id not in copied:
+            await bot.copy_messages(
+                chat_id, payload["from_chat_id"], payload["message_ids"], remove_caption=payload.get("remove_caption")
+            )
+            copied.add(chat_id)
+        if payload.get("text"):
+            await bot.send_message(chat_id, payload["text"])
+        copied.discard(chat_id)
+    return send
+
+# Фото з /t до появи copy_message (для продовження старих розсилок)
+def make_photo_send(payload):
+    async def send(chat_id):
+        await bot.send_photo(chat_id=chat_id, photo=payload["photo_id"], caption=payload["caption"] or None)
+    return send
+
+# Щоденна розсилка має власний темп (DELIVERY_RATE) у межах спільного ліміту
+outbox.register(
+    "daily",
+    make_daily_send,
+    limiter=broadcast.ChainedLimiter(broadcast.TokenBucket(DELIVERY_RATE), broadcast.global_limiter),
+)
+outbox.register("text", make_text_send)
+outbox.register("photo", make_photo_send)
+outbox.register("copy", make_copy_send)
+
+# Набір зображень щоденної розсилки на день day. Вибирається один раз на
+# день (першою репліка, що його збереже) і використовується для всіх хвилин
+# вікна та для пропущених хвилин, тож кожне фото завантажується в Telegram
+# лише один раз. Якщо база недоступна, набір зберігається лише в цьому процесі.
+async def get_daily_images(day):
+    day = day.date()
+    if daily_image_sets.get(day):
+        return daily_image_sets[day]
+    try:
+        images = await db.get_daily_images(day)
+    except Exception as e:
+        logging.error(f"Помилка при завантаженні зображень щоденної розсилки: {e}")
+        images = None
+    if images is None:
+        images = [image_pool.draw(DAILY_IMAGE_QUERY) for _ in range(DAILY_IMAGES_PER_BROADCAST)]
+        images = [image for image in images if image]
+        if images:  # порожній набір (пул ще не заповнився) не зберігається
+            try:
+                images = await db.save_daily_images(day, images)
+            except Exception as e:
+                logging.error(f"Помилка при збереженні зображень щоденної розсилки: {e}")
+    if images:
+        daily_image_sets.clear()
+        daily_image_sets[day] = images
+    return images
+
+# Функція для розсилки випадкових приємних повідомлень.
+# minute — хвилина доби: лише користувачі з цим слотом (інакше всі користувачі).
+# З background=True розсилка лише створюється, а надсилає її черга розсилок
+# у фоні (під орендою, тож її продовжить інша репліка, якщо ця зупиниться).
+async def send_random_messages(shard=None, minute=None, background=False, day=None):
+    # Набір зображень дня, щоб не завантажувати нове фото для кожного користувача
+    broadcast_images = await get_daily_images(day or datetime.now(kyiv_tz))
+
+    if minute is None:
+        recipients = iter_user_ids(shard=shard)
+    else:
+        recipients = delivery_planner.iter_due_user_ids(minute, shard)
+    if background:
+        await outbox.start("daily", {"images": broadcast_images}, recipients)
+        return None
+    result = await outbox.send("daily", {"images": broadcast_images}, recipients)
+    logging.info(f"🗂 Кеш медіафайлів: {media_cache.stats()}")
+    return result
+
+# Ключ запуску щоденної розсилки в job_runs: дата і хвилина доставки
+def daily_run_key(day, minute):
+    return f"{day.strftime('%Y-%m-%d')}T{minute // 60:02d}:{minute % 60:02d}"
+
+# Доставка користувачам зі слотом minute.
+# Кожну хвилину виконує лише одна репліка (або кожна — свою частину).
+# Запуск у job_runs завершується, щойно розсилку записано в чергу, — далі
+# за неї відповідає оренда розсилки.
+async def deliver_minute(day, minute, takeover_delay=cluster.SHARD_TAKEOVER_DELAY):
+    async def run(shard):
+        await send_random_messages(shard, minute, background=True, day=day)
+
+    await cluster.run_job(
+        "daily", daily_run_key(day, minute), run, shard_count=DELIVERY_SHARDS, takeover_delay=takeover_delay
+    )
 
-# Планувальник для щоденних повідомлень
+# Щохвилинна доставка користувачам, чий слот припадає на поточну хвилину
+async def daily_job():
+    now = datetime.now(kyiv_tz)
+    minute = now.hour * 60 + now.minute
+    if await delivery_planner.has_due(minute):
+        await deliver_minute(now, minute)
+
+# Доставка за сьогоднішні хвилини, які вже минули, але так і не почалися
+# (бот перезапускався або був зупинений під час вікна розсилки) або чия
+# репліка зупинилася, не завершивши запуск (оренда в job_runs спливла).
+# Усі вільні частини таких хвилин ця репліка забирає одразу.
+async def catch_up_daily():
+    now = datetime.now(kyiv_tz)
+    minutes = await delivery_planner.due_minutes(until=now.hour * 60 + now.minute)
+    run_keys = {daily_run_key(now, minute): minute for minute in minutes}
+    missed = await cluster.unclaimed_runs("daily", list(run_keys), DELIVERY_SHARDS)
+    if missed:
+        logging.warning(f"⏰ {len(missed)} хвилин щоденної розсилки пропущено або не завершено, надсилаю зараз.")
+    for run_key in missed:
+        await deliver_minute(now, run_keys[run_key], takeover_delay=0)
+
+# Планувальник для щоденних повідомлень. Доставки сусідніх хвилин можуть
+# перекриватися, тому дозволено кілька одночасних запусків.
 scheduler = AsyncIOScheduler()
-scheduler.add_job(send_random_messages, CronTrigger(hour=18, minute=0, timezone=kyiv_tz))
+scheduler.add_job(
+    daily_job,
+    CronTrigger(minute="*", timezone=kyiv_tz),
+    max_instances=DELIVERY_WINDOW_MINUTES + 10,
+    misfire_grace_time=30,
+)
+# Слоти користувачів з власним часовим поясом зсуваються при переході на літній/зимовий час
+scheduler.add_job(delivery_planner.recompute, CronTrigger(minute=5, timezone=kyiv_tz), kwargs={"only_custom": True})
+# Завершені розсилки (щоденна створює їх на кожну хвилину вікна) видаляються через RETENTION_DAYS днів
+scheduler.add_job(outbox.prune, CronTrigger(hour=4, minute=30, timezone=kyiv_tz))
+# Розсилки й запуски щоденної розсилки, чиї репліки зупинилися і не повернулися
+# (оренда спливла), забирає ця репліка
+scheduler.add_job(outbox.resume, CronTrigger(minute="*", second=30, timezone=kyiv_tz), kwargs={"takeover_only": True})
+scheduler.add_job(catch_up_daily, CronTrigger(minute="*/5", second=45, timezone=kyiv_tz))
+
+# Запуск сервісів бота (викликається диспетчером при старті в обох режимах).
+# Планувальник і продовження розсилок працюють лише в основному процесі.
+@dp.startup()
+async def on_startup(is_primary=True):
+    await db.init_db(DATABASE_URL)
+    await image_pool.start([DAILY_IMAGE_QUERY, NEW_PHOTO_QUERY])
+    await media_cache.start()
+    await outbox.init()
+    await cluster.init()
+    await delivery_planner.init()
+    await reaction_pipeline.init()
+    await content_rotation.init()
+    reaction_pipeline.start()
+    if is_primary:
+        await outbox.resume()
+        scheduler.start()
+        scheduler.add_job(catch_up_daily)  # одразу після старту
+
+# Зупинка сервісів бота в межах SHUTDOWN_TIMEOUT. Спершу призупиняється
+# планувальник, щоб не почалися нові розсилки, потім одночасно дочікуються
+# розсилки та обробники оновлень (drain_updates — лише в режимі webhook).
+# Сесію бота закриває вже після цього aiogram або webhook.
+@dp.shutdown()
+async def on_shutdown(drain_updates=None):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SHUTDOWN_TIMEOUT
+    if scheduler.running:
+        scheduler.pause()
+
+    drain_timeout = max(0, deadline - SHUTDOWN_CLOSE_RESERVE - loop.time())
+    drains = [outbox.close(timeout=drain_timeout)]
+    if drain_updates is not None:
+        drains.append(drain_updates(drain_timeout))
+    await asyncio.gather(*drains)
+    if scheduler.running:
+        scheduler.shutdown(wait=False)  # скасовує завдання, що ще виконуються
+
+    try:
+        await asyncio.wait_for(reaction_pipeline.close(), timeout=max(0, deadline - loop.time()))
+    except asyncio.TimeoutError:
+        logging.warning("⚠️ Не вдалося записати залишок реакцій до зупинки.")
+    await media_cache.close()
+    await image_pool.close()
+    await db.close_db()
 
 # Основна функція запуску бота
 async def main():
-    scheduler.start()
-    await dp.start_polling(bot)
+    metrics_server = await metrics.start_server(WEB_HOST, int(METRICS_PORT)) if METRICS_PORT else None
+    await bot.delete_webhook()  # getUpdates не працює, поки встановлено вебхук
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics_server is not None:
+            await metrics_server.cleanup()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if BOT_MODE == "webhook":
+        webhook.run(
+            dp,
+            bot,
+            host=WEB_HOST,
+            port=WEB_PORT,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}" if WEBHOOK_URL else None,
+            workers=WEB_WORKERS,
+        )
+    else:
+        asyncio.run(main())
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+import metrics
+
+# Ліміти Telegram: ~30 повідомлень/с загалом і ~1 повідомлення/с в один чат
+GLOBAL_RATE = 25  # повідомлень на секунду, із запасом до ліміту
+PER_CHAT_INTERVAL = 1.0  # секунд між повідомленнями в один чат
+WORKERS = 20
+MAX_ATTEMPTS = 4  # спроб на одного отримувача при тимчасових помилках
+BACKOFF_BASE = 1.0  # секунд, подвоюється з кожною спробою
+
+# Помилки, після яких варто повторити відправку
+TRANSIENT_ERRORS = (TelegramNetworkError, TelegramServerError, asyncio.TimeoutError, ConnectionError)
+
+
+# Отримувача пропущено без результату (наприклад, його вже обробляє інша репліка)
+class SkipRecipient(Exception):
+    pass
+
+
+# Постійна помилка: користувач заблокував бота, видалив акаунт або чату не існує.
+# Такому отримувачу надсилати більше немає сенсу (статус "blocked").
+def is_permanent_error(error):
+    if isinstance(error, TelegramForbiddenError):
+        return True
+    return isinstance(error, TelegramBadRequest) and "chat not found" in error.message.lower()
+
+
+# Помилки Telegram, які спричинило саме повідомлення, а не отримувач: вони
+# повторяться для будь-кого (наприклад, адміністратор видалив джерело /t)
+SENDER_ERRORS = (
+    "message to copy not found",
+    "message to forward not found",
+    "message_id_invalid",
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "failed to get http url content",
+    "wrong type of the web page content",
+    "message text is empty",
+    "message is too long",
+    "caption is too long",
+    "can't parse entities",
+)
+
+
+# Помилка доставки, яку спричинив чат отримувача (статус "failed"). Решта
+# помилок — на боці бота або Telegram (статус "error"): немає зображень,
+# збій бази, некоректне повідомлення, недоступність Telegram після повторів.
+def is_recipient_error(error):
+    if not isinstance(error, (TelegramBadRequest, TelegramForbiddenError)):
+        return False
+    message = error.message.lower()
+    return not any(pattern in message for pattern in SENDER_ERRORS)
+
+
+# Глобальний обмежувач швидкості (token bucket).
+# Невеликий запас токенів не дає перевищити ліміт у перше ж вікно в 1 с.
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate / 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    # Призупинення видачі токенів (наприклад, після TelegramRetryAfter)
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Обмежувач швидкості для окремих чатів
+class PerChatLimiter:
+    def __init__(self, interval=PER_CHAT_INTERVAL):
+        self.interval = interval
+        self._next_allowed = {}
+
+    async def acquire(self, chat_id):
+        now = time.monotonic()
+        next_allowed = self._next_allowed.get(chat_id, now)
+        self._next_allowed[chat_id] = max(now, next_allowed) + self.interval
+        if next_allowed > now:
+            await asyncio.sleep(next_allowed - now)
+        if len(self._next_allowed) > 10000:
+            self._cleanup(now)
+
+    def _cleanup(self, now):
+        for chat_id in [c for c, t in self._next_allowed.items() if t <= now]:
+            del self._next_allowed[chat_id]
+
+
+# Послідовне отримання токенів з кількох обмежувачів — наприклад, власного
+# темпу розсилки і спільного ліміту Telegram
+class ChainedLimiter:
+    def __init__(self, *limiters):
+        self.limiters = limiters
+
+    def pause(self, seconds):
+        for limiter in self.limiters:
+            limiter.pause(seconds)
+
+    async def acquire(self):
+        for limiter in self.limiters:
+            await limiter.acquire()
+
+
+# Підсумок розсилки
+@dataclass
+class BroadcastResult:
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    error: int = 0  # помилки на боці бота, а не отримувача
+    duration: float = 0.0
+    blocked_ids: list = field(default_factory=list)
+    cancelled: bool = False
+
+    @property
+    def total(self):
+        return self.sent + self.failed + self.blocked + self.error
+
+    def summary(self):
+        rate = self.sent / self.duration if self.duration else 0.0
+        return (
+            ("⛔ Розсилку скасовано\n" if self.cancelled else "")
+            + f"✅ Надіслано: {self.sent}\n"
+            f"⚠️ Помилок: {self.failed}\n"
+            f"🚫 Заблокували бота: {self.blocked}\n"
+            + (f"🛠 Помилок бота: {self.error}\n" if self.error else "")
+            + f"⏱ Тривалість: {self.duration:.1f} с ({rate:.1f} повід./с)"
+        )
+
+
+# Спільні обмежувачі для всіх розсилок процесу
+global_limiter = TokenBucket(GLOBAL_RATE)
+chat_limiter = PerChatLimiter()
+
+
+# Розсилка повідомлень списку отримувачів.
+# recipients — звичайний або асинхронний ітератор chat_id,
+# send — корутина send(chat_id), яка надсилає повідомлення одному отримувачу,
+# on_result — необов'язкова корутина on_result(chat_id, status), яка отримує
+# остаточний статус кожного отримувача ("sent", "failed", "blocked" або "error").
+async def broadcast(recipients, send, workers=WORKERS, limiter=None, per_chat=None, on_result=None):
+    limiter = limiter or global_limiter
+    per_chat = per_chat or chat_limiter
+    result = BroadcastResult()
+    queue = asyncio.Queue(maxsize=workers * 4)
+    retries = set()
+    started = time.monotonic()
+
+    # Повторна постановка в чергу після затримки. task_done для поточного
+    # елемента викликається лише після повторної постановки, щоб queue.join()
+    # не завершився передчасно.
+    async def requeue(chat_id, attempt, delay):
+        await asyncio.sleep(delay)
+        await queue.put((chat_id, attempt))
+        queue.task_done()
+
+    async def worker():
+        while True:
+            chat_id, attempt = await queue.get()
+            retry_delay = None
+            status = "error"
+            try:
+                await limiter.acquire()
+                await per_chat.acquire(chat_id)
+                await send(chat_id)
+                result.sent += 1
+                status = "sent"
+                logging.info(f"📨 Повідомлення надіслано {chat_id}")
+            except SkipRecipient:
+                queue.task_done()
+                continue
+            except TelegramRetryAfter as e:
+                logging.warning(f"⏳ Перевищено ліміт Telegram, пауза {e.retry_after} с (користувач {chat_id})")
+                limiter.pause(e.retry_after)
+                retry_delay = e.retry_after
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                if is_permanent_error(e):
+                    result.blocked += 1
+                    result.blocked_ids.append(chat_id)
+                    status = "blocked"
+                    logging.warning(f"🚫 Користувач {chat_id} недоступний: {e}")
+                elif is_recipient_error(e):
+                    result.failed += 1
+                    status = "failed"
+                    logging.warning(f"⚠️ Не вдалося надіслати {chat_id}: {e}")
+                else:
+                    result.error += 1
+                    logging.error(f"🛠 Помилка повідомлення для {chat_id}: {e}")
+            except TRANSIENT_ERRORS as e:
+                if attempt + 1 < MAX_ATTEMPTS:
+                    retry_delay = BACKOFF_BASE * 2 ** attempt + random.uniform(0, BACKOFF_BASE)
+                    attempt += 1
+                    logging.warning(f"⚠️ Тимчасова помилка для {chat_id}, повтор через {retry_delay:.1f} с: {e}")
+                else:
+                    result.error += 1
+                    logging.error(f"🛠 Не вдалося надіслати {chat_id} після {MAX_ATTEMPTS} спроб: {e}")
+            except Exception as e:
+                result.error += 1
+                logging.error(f"🛠 Помилка бота при надсиланні {chat_id}: {e}")
+
+            if retry_delay is not None:
+                task = asyncio.create_task(requeue(chat_id, attempt, retry_delay))
+                retries.add(task)
+                task.add_done_callback(retries.discard)
+                continue
+
+            metrics.messages.inc(status=status)
+            if on_result is not None:
+                try:
+                    await on_result(chat_id, status)
+                except Exception as e:
+                    logging.error(f"Помилка при обробці результату для {chat_id}: {e}")
+            queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        if hasattr(recipients, "__aiter__"):
+            async for chat_id in recipients:
+                await queue.put((chat_id, 0))
+        else:
+            for chat_id in recipients:
+                await queue.put((chat_id, 0))
+        await queue.join()
+    finally:
+        for task in [*tasks, *retries]:
+            task.cancel()
+        await asyncio.gather(*tasks, *retries, return_exceptions=True)
+
+    result.duration = time.monotonic() - started
+    logging.info(
+        f"📬 Розсилку завершено: надіслано {result.sent}, помилок {result.failed}, "
+        f"заблокували {result.blocked}, помилок бота {result.error}, {result.duration:.1f} с"
+    )
+    return result
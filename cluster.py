@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import os
+import socket
+
+import db
+
+SHARD_TAKEOVER_DELAY = 120  # секунд, після яких вільні частини розсилки забирають інші репліки
+# Оренда запуску: поки завдання виконується, репліка продовжує її кожні
+# LEASE_RENEW_INTERVAL секунд. Незавершений запуск, оренду якого не
+# продовжували LEASE_TIMEOUT секунд, може захопити інша репліка.
+LEASE_TIMEOUT = 90
+LEASE_RENEW_INTERVAL = 30
+
+
+# Ідентифікатор і номер репліки. На Heroku DYNO має вигляд "worker.3",
+# тож за замовчуванням номер береться звідти (нумерація з нуля).
+def replica_id():
+    return os.getenv("REPLICA_ID") or os.getenv("DYNO") or socket.gethostname()
+
+
+def replica_index():
+    if os.getenv("REPLICA_INDEX"):
+        return int(os.getenv("REPLICA_INDEX"))
+    dyno = os.getenv("DYNO", "")
+    if "." in dyno and dyno.rsplit(".", 1)[1].isdigit():
+        return int(dyno.rsplit(".", 1)[1]) - 1
+    return 0
+
+
+async def init():
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_name TEXT NOT NULL,
+            run_key TEXT NOT NULL,
+            shard INTEGER NOT NULL,
+            replica TEXT NOT NULL,
+            claimed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (job_name, run_key, shard)
+        )
+    ''')
+    # Кінець оренди незавершеного запуску; NULL — запуск виконано
+    await db.execute('ALTER TABLE job_runs ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ')
+
+
+# Захоплення запуску завдання (оренда в таблиці job_runs). Лише одна репліка
+# може захопити пару (run_key, shard), тому інші пропускають цей запуск.
+# Запуск, оренда якого спливла (репліка зупинилася, не завершивши його),
+# захоплюється повторно.
+async def claim_run(job_name, run_key, shard=0):
+    claimed_by = await db.fetchval('''
+        INSERT INTO job_runs (job_name, run_key, shard, replica, lease_until)
+        VALUES ($1, $2, $3, $4, now() + make_interval(secs => $5))
+        ON CONFLICT (job_name, run_key, shard) DO UPDATE
+            SET replica = EXCLUDED.replica, claimed_at = now(), lease_until = EXCLUDED.lease_until
+            WHERE job_runs.lease_until < now()
+        RETURNING replica
+    ''', job_name, run_key, shard, replica_id(), LEASE_TIMEOUT)
+    return claimed_by is not None
+
+
+# Продовження оренди запуску (False, якщо його вже захопила інша репліка)
+async def renew_run(job_name, run_key, shard=0):
+    renewed = await db.fetchval('''
+        UPDATE job_runs SET lease_until = now() + make_interval(secs => $5)
+        WHERE job_name = $1 AND run_key = $2 AND shard = $3 AND replica = $4 AND lease_until IS NOT NULL
+        RETURNING shard
+    ''', job_name, run_key, shard, replica_id(), LEASE_TIMEOUT)
+    return renewed is not None
+
+
+async def finish_run(job_name, run_key, shard=0):
+    await db.execute('''
+        UPDATE job_runs SET lease_until = NULL
+        WHERE job_name = $1 AND run_key = $2 AND shard = $3 AND replica = $4
+    ''', job_name, run_key, shard, replica_id())
+
+
+# Ключі запусків з run_keys, які ніхто не виконує: для них немає записів
+# у job_runs для всіх shard_count частин або оренда якоїсь частини спливла
+async def unclaimed_runs(job_name, run_keys, shard_count=1):
+    rows = await db.fetch('''
+        SELECT k.run_key FROM unnest($2::text[]) AS k(run_key)
+        WHERE (
+            SELECT count(*) FROM job_runs AS j
+            WHERE j.job_name = $1 AND j.run_key = k.run_key AND (j.lease_until IS NULL OR j.lease_until >= now())
+        ) < $3
+        ORDER BY k.run_key
+    ''', job_name, run_keys, max(1, shard_count))
+    return [row['run_key'] for row in rows]
+
+
+# Виконання захопленого запуску з продовженням оренди. Після успішного
+# завершення запуск позначається виконаним; якщо ж репліка зупиниться
+# раніше, оренда спливе і запуск повторить інша репліка.
+async def _run_claimed(job_name, run_key, shard, run, part):
+    async def keep_lease():
+        while True:
+            await asyncio.sleep(LEASE_RENEW_INTERVAL)
+            try:
+                if not await renew_run(job_name, run_key, shard):
+                    logging.warning(f"⚠️ Завдання {job_name} ({run_key}) захопила інша репліка.")
+                    return
+            except Exception as e:
+                logging.error(f"Не вдалося продовжити оренду завдання {job_name} ({run_key}): {e}")
+
+    lease = asyncio.create_task(keep_lease())
+    try:
+        await run(part)
+    finally:
+        lease.cancel()
+    await finish_run(job_name, run_key, shard)
+
+
+# Запуск завдання в кластері з кількох реплік.
+# Без шардування (shard_count <= 1) завдання виконує лише одна репліка —
+# та, що першою захопила запуск. Із шардуванням кожна репліка спершу
+# виконує свою частину run(shard), а потім, після SHARD_TAKEOVER_DELAY,
+# забирає частини реплік, які так і не почали роботу.
+async def run_job(job_name, run_key, run, shard_count=1, takeover_delay=SHARD_TAKEOVER_DELAY):
+    if shard_count <= 1:
+        if await claim_run(job_name, run_key):
+            await _run_claimed(job_name, run_key, 0, run, None)
+        else:
+            logging.info(f"⏭ Завдання {job_name} ({run_key}) вже виконує інша репліка.")
+        return
+
+    own_shard = replica_index() % shard_count
+    if await claim_run(job_name, run_key, own_shard):
+        logging.info(f"🧩 Репліка {replica_id()} виконує частину {own_shard + 1}/{shard_count} завдання {job_name}.")
+        await _run_claimed(job_name, run_key, own_shard, run, (own_shard, shard_count))
+
+    await asyncio.sleep(takeover_delay)
+    for shard in range(shard_count):
+        if shard != own_shard and await claim_run(job_name, run_key, shard):
+            logging.warning(f"🧩 Частину {shard + 1}/{shard_count} завдання {job_name} не забрала її репліка, виконую.")
+            await _run_claimed(job_name, run_key, shard, run, (shard, shard_count))
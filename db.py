@@ -0,0 +1,271 @@
+import asyncio
+import contextlib
+import json
+import logging
+import time
+
+import asyncpg
+
+import metrics
+
+# Пул з'єднань з PostgreSQL (створюється у init_db)
+pool = None
+
+# Параметри пулу та повторних спроб
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+QUERY_TIMEOUT = 10  # секунд на один запит
+STATEMENT_CACHE_SIZE = 100  # кеш підготовлених запитів на кожне з'єднання
+RETRY_ATTEMPTS = 3
+RETRY_DELAY = 0.5  # секунд, подвоюється з кожною спробою
+SLOW_QUERY_MS = 200  # запити, довші за цей поріг, логуються як попередження
+DAILY_IMAGES_RETENTION_DAYS = 7  # скільки днів зберігати набори зображень щоденної розсилки
+
+# Помилки втраченого з'єднання, після яких запит повторюється. Розірване
+# з'єднання пул закриває і при наступному acquire відкриває нове, тож
+# перестворювати весь пул не потрібно. Тайм-аут запиту сюди не входить:
+# запит міг уже виконатися, а повтор неідемпотентного оновлення подвоїв би його.
+RETRY_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    ConnectionError,
+)
+
+_dsn = None
+_ssl = None
+
+
+# Ініціалізація пулу та створення таблиць
+async def init_db(dsn, ssl="require"):
+    global pool, _dsn, _ssl
+    _dsn, _ssl = dsn, ssl
+    pool = await _create_pool()
+    await execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            user_id BIGINT UNIQUE NOT NULL,
+            username TEXT,
+            first_name TEXT
+        )
+    ''')
+    # Стан доставки: неактивним користувачам розсилки не надсилаються
+    await execute('''
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT true,
+            ADD COLUMN IF NOT EXISTS consecutive_failures INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS last_success_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS deactivated_at TIMESTAMPTZ,
+            ADD COLUMN IF NOT EXISTS deactivation_reason TEXT
+    ''')
+    await execute('CREATE INDEX IF NOT EXISTS users_active_idx ON users (user_id) WHERE active')
+    await execute('''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            source_url TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    ''')
+    # Набір зображень щоденної розсилки на кожен день (спільний для всіх реплік)
+    await execute('''
+        CREATE TABLE IF NOT EXISTS daily_images (
+            day DATE PRIMARY KEY,
+            images TEXT NOT NULL
+        )
+    ''')
+    logging.info("🗄 Пул з'єднань з базою даних готовий.")
+
+
+async def _create_pool():
+    return await asyncpg.create_pool(
+        _dsn,
+        ssl=_ssl,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        command_timeout=QUERY_TIMEOUT,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+    )
+
+
+# Закриття пулу при зупинці бота
+async def close_db():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+# Виконання запиту з вимірюванням часу та повторними спробами.
+# asyncpg автоматично готує і кешує запити на кожному з'єднанні,
+# тому повторні виклики з тим самим текстом запиту не парсяться заново.
+async def _run(method, query, *args):
+    delay = RETRY_DELAY
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        started = time.perf_counter()
+        try:
+            async with pool.acquire() as conn:
+                result = await getattr(conn, method)(query, *args, timeout=QUERY_TIMEOUT)
+        except RETRY_ERRORS as e:
+            metrics.db_errors.inc(method=method)
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            logging.warning(f"⚠️ Помилка з'єднання з БД (спроба {attempt}): {e}")
+            await asyncio.sleep(delay)
+            delay *= 2
+            continue
+        except Exception:
+            metrics.db_errors.inc(method=method)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.db_query_seconds.observe(elapsed, method=method)
+        elapsed_ms = elapsed * 1000
+        if elapsed_ms >= SLOW_QUERY_MS:
+            logging.warning(f"🐢 Повільний запит ({elapsed_ms:.1f} мс): {' '.join(query.split())[:120]}")
+        else:
+            logging.debug(f"🗄 Запит виконано за {elapsed_ms:.1f} мс: {' '.join(query.split())[:120]}")
+        return result
+
+
+# Виконання кількох запитів в одній транзакції:
+#     async with db.transaction() as conn:
+#         await conn.execute(...)
+@contextlib.asynccontextmanager
+async def transaction():
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            yield conn
+
+
+async def execute(query, *args):
+    return await _run("execute", query, *args)
+
+
+async def executemany(query, args):
+    return await _run("executemany", query, args)
+
+
+async def fetch(query, *args):
+    return await _run("fetch", query, *args)
+
+
+async def fetchrow(query, *args):
+    return await _run("fetchrow", query, *args)
+
+
+async def fetchval(query, *args):
+    return await _run("fetchval", query, *args)
+
+
+# Функція для додавання користувача до бази даних
+async def add_user(user_id, username, first_name):
+    try:
+        await execute('''
+            INSERT INTO users (user_id, username, first_name)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (user_id) DO NOTHING
+        ''', user_id, username, first_name)
+        logging.info(f"Користувач {user_id} доданий до бази даних.")
+    except Exception as e:
+        logging.error(f"Помилка при додаванні користувача {user_id}: {e}")
+
+
+# Функція для видалення користувача з бази даних
+async def remove_user(user_id):
+    try:
+        await execute('DELETE FROM users WHERE user_id = $1', user_id)
+        logging.info(f"Користувач {user_id} видалений із бази даних.")
+    except Exception as e:
+        logging.error(f"Помилка при видаленні користувача {user_id}: {e}")
+
+
+# Функція для отримання одного користувача за user_id
+async def get_user(user_id):
+    return await fetchrow('SELECT user_id, username, first_name FROM users WHERE user_id = $1', user_id)
+
+
+# Потокове читання користувачів пакетами, впорядкованими за user_id
+# (keyset-пагінація: пам'ять не залежить від розміру таблиці).
+# shard=(index, count) обмежує вибірку однією частиною користувачів,
+# active_only — лише користувачами, яким можна надсилати розсилки.
+async def iter_users(batch_size=1000, shard=None, active_only=False):
+    after_user_id = -2 ** 63
+    while True:
+        batch = await get_users_page(after_user_id, batch_size, shard, active_only)
+        if not batch:
+            return
+        for user in batch:
+            yield user
+        after_user_id = batch[-1]['user_id']
+
+
+# Функція для отримання сторінки користувачів після заданого user_id.
+# Частина (shard) визначається хешем user_id, тож користувачі
+# розподіляються між частинами рівномірно.
+async def get_users_page(after_user_id, limit, shard=None, active_only=False):
+    conditions = ["user_id > $1"]
+    args = [after_user_id, limit]
+    if active_only:
+        conditions.append("active")
+    if shard is not None:
+        conditions.append("(hashint8(user_id) & 2147483647) % $4 = $3")
+        args.extend(shard)
+    return await fetch(f'''
+        SELECT user_id, username, first_name FROM users
+        WHERE {" AND ".join(conditions)}
+        ORDER BY user_id
+        LIMIT $2
+    ''', *args)
+
+
+# Функція для отримання сторінки користувачів перед заданим user_id
+async def get_users_page_before(before_user_id, limit):
+    rows = await fetch('''
+        SELECT user_id, username, first_name FROM users
+        WHERE user_id < $1
+        ORDER BY user_id DESC
+        LIMIT $2
+    ''', before_user_id, limit)
+    return list(reversed(rows))
+
+
+# Функція для отримання збережених file_id медіафайлів (найсвіжіші першими)
+async def get_media_file_ids(limit):
+    try:
+        return await fetch('''
+            SELECT source_url, file_id FROM media_cache
+            ORDER BY updated_at DESC
+            LIMIT $1
+        ''', limit)
+    except Exception as e:
+        logging.error(f"Помилка при завантаженні кешу медіафайлів: {e}")
+        return []
+
+
+# Функція для збереження file_id медіафайлу
+async def save_media_file_id(source_url, file_id):
+    try:
+        await execute('''
+            INSERT INTO media_cache (source_url, file_id)
+            VALUES ($1, $2)
+            ON CONFLICT (source_url) DO UPDATE SET file_id = EXCLUDED.file_id, updated_at = now()
+        ''', source_url, file_id)
+    except Exception as e:
+        logging.error(f"Помилка при збереженні file_id для {source_url}: {e}")
+
+
+# Функція для отримання набору зображень щоденної розсилки на день day (None, якщо його ще не вибрано)
+async def get_daily_images(day):
+    images = await fetchval('SELECT images FROM daily_images WHERE day = $1', day)
+    return None if images is None else json.loads(images)
+
+
+# Функція для збереження набору зображень на день day. Якщо інша репліка
+# вже зберегла свій набір, повертається саме він.
+async def save_daily_images(day, images):
+    await execute('''
+        INSERT INTO daily_images (day, images) VALUES ($1, $2)
+        ON CONFLICT (day) DO NOTHING
+    ''', day, json.dumps(images))
+    await execute(
+        'DELETE FROM daily_images WHERE day < $1::date - $2::int', day, DAILY_IMAGES_RETENTION_DAYS
+    )
+    return await get_daily_images(day)
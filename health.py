@@ -0,0 +1,94 @@
+import logging
+
+import db
+
+# Скільки розсилок поспіль можуть завершитися помилкою, перш ніж
+# користувача буде вимкнено (тимчасові помилки повторюються ще в broadcast)
+MAX_CONSECUTIVE_FAILURES = 7
+
+BLOCKED = "blocked"
+FAILURES = "failures"
+
+# Статуси, що описують доставку самому користувачу. Помилки на боці бота
+# ("error") стан користувача не змінюють.
+DELIVERY_STATUSES = ("sent", "failed", "blocked")
+
+
+# Оновлення стану доставки за пакетом результатів розсилки [(user_id, status)].
+# Успіх обнуляє лічильник помилок, постійна помилка ("blocked") одразу
+# вимикає користувача, а MAX_CONSECUTIVE_FAILURES помилок поспіль — теж.
+async def record_results(results):
+    results = [(user_id, status) for user_id, status in results if status in DELIVERY_STATUSES]
+    if not results:
+        return
+    deactivated = await db.fetchval('''
+        WITH results AS (
+            SELECT DISTINCT ON (user_id) user_id, status
+            FROM unnest($1::bigint[], $2::text[]) AS r(user_id, status)
+        ), updated AS (
+            UPDATE users AS u SET
+                consecutive_failures = CASE WHEN r.status = 'sent' THEN 0 ELSE u.consecutive_failures + 1 END,
+                last_success_at = CASE WHEN r.status = 'sent' THEN now() ELSE u.last_success_at END,
+                active = u.active AND r.status <> 'blocked' AND (r.status = 'sent' OR u.consecutive_failures + 1 < $3),
+                deactivated_at = CASE
+                    WHEN u.active AND (r.status = 'blocked' OR (r.status <> 'sent' AND u.consecutive_failures + 1 >= $3))
+                    THEN now() ELSE u.deactivated_at END,
+                deactivation_reason = CASE
+                    WHEN u.active AND r.status = 'blocked' THEN $4
+                    WHEN u.active AND r.status <> 'sent' AND u.consecutive_failures + 1 >= $3 THEN $5
+                    ELSE u.deactivation_reason END
+            FROM results AS r
+            WHERE u.user_id = r.user_id
+            RETURNING u.user_id, u.active
+        )
+        -- users тут ще містить стан до оновлення
+        SELECT count(*) FROM updated JOIN users AS old USING (user_id)
+        WHERE old.active AND NOT updated.active
+    ''', [user_id for user_id, _ in results], [status for _, status in results],
+        MAX_CONSECUTIVE_FAILURES, BLOCKED, FAILURES)
+    if deactivated:
+        logging.warning(f"🚫 Вимкнено розсилку для {deactivated} користувачів.")
+
+
+# Повернення користувача до розсилки (наприклад, після повторного /start)
+async def reactivate(user_id):
+    await db.execute('''
+        UPDATE users
+        SET active = true, consecutive_failures = 0, deactivated_at = NULL, deactivation_reason = NULL
+        WHERE user_id = $1 AND NOT active
+    ''', user_id)
+
+
+# Звіт для адміністратора: загальні числа та останні вимкнені користувачі
+async def report(limit=10):
+    totals = await db.fetchrow('''
+        SELECT
+            count(*) FILTER (WHERE active) AS active,
+            count(*) FILTER (WHERE NOT active) AS inactive,
+            count(*) FILTER (WHERE active AND consecutive_failures > 0) AS failing
+        FROM users
+    ''')
+    recent = await db.fetch('''
+        SELECT user_id, username, first_name, deactivation_reason, deactivated_at, last_success_at
+        FROM users
+        WHERE NOT active
+        ORDER BY deactivated_at DESC NULLS LAST
+        LIMIT $1
+    ''', limit)
+
+    lines = [
+        f"✅ Активних: {totals['active']}",
+        f"🚫 Вимкнених: {totals['inactive']}",
+        f"⚠️ З помилками доставки: {totals['failing']}",
+    ]
+    if recent:
+        lines.append("\nОстанні вимкнені:")
+    for row in recent:
+        reason = "заблокував бота" if row['deactivation_reason'] == BLOCKED else "помилки доставки"
+        last_success = row['last_success_at'].strftime('%d.%m.%Y') if row['last_success_at'] else "ніколи"
+        deactivated = row['deactivated_at'].strftime('%d.%m.%Y') if row['deactivated_at'] else "—"
+        lines.append(
+            f"🆔 {row['user_id']} {row['first_name']} (@{row['username']}) — {reason}, "
+            f"{deactivated}, остання доставка: {last_success}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+import aiohttp
+
+import metrics
+
+PIXABAY_API_URL = "https://pixabay.com/api/"
+
+# Параметри пулу зображень
+PAGE_SIZE = 100  # скільки зображень запитувати за один раз (Pixabay дозволяє до 200)
+LOW_WATER = 20  # нижче цього рівня пул поповнюється у фоні
+IMAGE_TTL = 6 * 60 * 60  # секунд, після яких посилання вважається застарілим
+RECENT_SIZE = 50  # запасні зображення на випадок, якщо пул тимчасово порожній
+REQUEST_TIMEOUT = 15  # секунд на запит до Pixabay
+
+
+# Пул зображень з Pixabay: тримає в пам'яті запас посилань для кожного запиту
+# і поповнює його у фоні, тож видача зображення не потребує мережевих запитів.
+class ImagePool:
+    def __init__(self, api_key, page_size=PAGE_SIZE, low_water=LOW_WATER, ttl=IMAGE_TTL, api_url=PIXABAY_API_URL):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.page_size = page_size
+        self.low_water = low_water
+        self.ttl = ttl
+        self._session = None
+        self._pools = {}  # query -> {image_id: (hit, expires_at)}
+        self._next_page = {}  # query -> номер наступної сторінки
+        self._recent = {}  # query -> deque останніх виданих зображень
+        self._refills = {}  # query -> фонове завдання поповнення
+
+    # Відкриття HTTP-сесії та початкове заповнення пулів
+    async def start(self, queries=()):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+        await asyncio.gather(*(self.refill(query) for query in queries))
+
+    # Зупинка фонових завдань і закриття HTTP-сесії
+    async def close(self):
+        for task in self._refills.values():
+            task.cancel()
+        await asyncio.gather(*self._refills.values(), return_exceptions=True)
+        self._refills.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def size(self, query):
+        self._evict_expired(query)
+        return len(self._pools.get(query, {}))
+
+    # Видача випадкового зображення з пам'яті (без мережевих запитів).
+    # Повертає словник {"id", "url"} або None, якщо зображень ще немає.
+    def draw(self, query):
+        self._evict_expired(query)
+        pool = self._pools.setdefault(query, {})
+        recent = self._recent.setdefault(query, deque(maxlen=RECENT_SIZE))
+
+        hit = None
+        if pool:
+            image_id = random.choice(list(pool))
+            hit, _ = pool.pop(image_id)
+            recent.append(hit)
+            metrics.image_draws.inc(source="pool")
+        elif recent:
+            hit = random.choice(recent)
+            metrics.image_draws.inc(source="recent")
+        else:
+            metrics.image_draws.inc(source="empty")
+
+        if len(pool) < self.low_water:
+            self._schedule_refill(query)
+        return hit
+
+    def _evict_expired(self, query):
+        pool = self._pools.get(query)
+        if not pool:
+            return
+        now = time.monotonic()
+        expired = [image_id for image_id, (_, expires_at) in pool.items() if expires_at <= now]
+        for image_id in expired:
+            del pool[image_id]
+
+    def _schedule_refill(self, query):
+        task = self._refills.get(query)
+        if task is not None and not task.done():
+            return
+        if self._session is None:
+            return
+        self._refills[query] = asyncio.create_task(self.refill(query))
+
+    # Завантаження наступної сторінки результатів у пул.
+    # Зображення, які вже є в пулі, пропускаються.
+    async def refill(self, query):
+        page = self._next_page.get(query, 1)
+        params = {
+            "key": self.api_key,
+            "q": query,
+            "image_type": "photo",
+            "per_page": self.page_size,
+            "page": page,
+        }
+        try:
+            with metrics.pixabay_request_seconds.time():
+                async with self._session.get(self.api_url, params=params) as response:
+                    if response.status != 200:
+                        metrics.pixabay_requests.inc(status="error")
+                        logging.warning(f"⚠️ Pixabay повернув статус {response.status} для запиту '{query}'.")
+                        # Після останньої сторінки Pixabay повертає помилку — починаємо спочатку
+                        self._next_page[query] = 1
+                        return
+                    data = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.pixabay_requests.inc(status="error")
+            logging.warning(f"⚠️ Не вдалося отримати зображення з Pixabay: {e}")
+            return
+        metrics.pixabay_requests.inc(status="ok")
+
+        pool = self._pools.setdefault(query, {})
+        expires_at = time.monotonic() + self.ttl
+        added = 0
+        for item in data.get("hits", []):
+            image_id = item["id"]
+            if image_id in pool:
+                continue
+            pool[image_id] = ({"id": image_id, "url": item["webformatURL"]}, expires_at)
+            added += 1
+
+        total_pages = max(1, -(-data.get("totalHits", 0) // self.page_size))
+        self._next_page[query] = page + 1 if page < total_pages else 1
+        logging.info(f"🖼 Пул зображень '{query}': +{added}, всього {len(pool)}.")
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from collections import OrderedDict
+
+import aiohttp
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile
+
+import db
+
+CACHE_SIZE = 1000  # скільки file_id тримати в пам'яті
+DOWNLOAD_TIMEOUT = 30  # секунд на завантаження зображення
+
+
+# Кеш медіафайлів: кожне зображення завантажується і надсилається в Telegram
+# лише один раз, а далі повторно використовується отриманий file_id.
+class MediaCache:
+    def __init__(self, capacity=CACHE_SIZE, persist=True):
+        self.capacity = capacity
+        self.persist = persist
+        self.hits = 0
+        self.misses = 0
+        self.uploads = 0
+        self._file_ids = OrderedDict()  # source_url -> file_id (LRU)
+        self._locks = {}  # source_url -> asyncio.Lock для одночасних запитів
+        self._session = None
+
+    # Завантаження збережених file_id з бази даних
+    async def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT))
+        if self.persist:
+            rows = await db.get_media_file_ids(self.capacity)
+            for row in reversed(rows):
+                self._file_ids[row['source_url']] = row['file_id']
+            logging.info(f"🗂 Кеш медіафайлів: завантажено {len(rows)} file_id.")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "uploads": self.uploads, "size": len(self._file_ids)}
+
+    def get(self, source_url):
+        file_id = self._file_ids.get(source_url)
+        if file_id is not None:
+            self._file_ids.move_to_end(source_url)
+        return file_id
+
+    async def put(self, source_url, file_id):
+        self._file_ids[source_url] = file_id
+        self._file_ids.move_to_end(source_url)
+        while len(self._file_ids) > self.capacity:
+            self._file_ids.popitem(last=False)
+        if self.persist:
+            await db.save_media_file_id(source_url, file_id)
+
+    # Видалення file_id, який Telegram більше не приймає
+    def forget(self, source_url):
+        self._file_ids.pop(source_url, None)
+
+    async def _download(self, source_url):
+        async with self._session.get(source_url) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    # Надсилання фото за посиланням. Перший виклик для посилання завантажує
+    # файл і надсилає його в Telegram, наступні використовують file_id.
+    async def send_photo(self, bot, chat_id, source_url, **kwargs):
+        file_id = self.get(source_url)
+        if file_id is not None:
+            self.hits += 1
+            try:
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if "file" not in str(e).lower():
+                    raise
+                logging.warning(f"⚠️ Telegram не прийняв file_id для {source_url}, завантажую заново: {e}")
+                self.forget(source_url)
+
+        lock = self._locks.setdefault(source_url, asyncio.Lock())
+        async with lock:
+            # Поки ми чекали, інший запит міг уже завантажити цей файл
+            file_id = self.get(source_url)
+            if file_id is not None:
+                self.hits += 1
+                return await bot.send_photo(chat_id, photo=file_id, **kwargs)
+
+            self.misses += 1
+            data = await self._download(source_url)
+            filename = source_url.rsplit("/", 1)[-1] or "image.jpg"
+            message = await bot.send_photo(chat_id, photo=BufferedInputFile(data, filename=filename), **kwargs)
+            self.uploads += 1
+            await self.put(source_url, message.photo[-1].file_id)
+        self._locks.pop(source_url, None)
+        return message
@@ -0,0 +1,225 @@
+import bisect
+import logging
+import time
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+# Межі кошиків гістограм затримок (секунди)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}  # name -> Counter | Histogram (у порядку реєстрації)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+# Лічильник, що лише зростає (окремо для кожного набору міток)
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        if labels:
+            return self._values.get(tuple(sorted(labels.items())), 0)
+        return sum(self._values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+# Гістограма значень (затримок) з фіксованими кошиками
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [лічильники кошиків..., +Inf], sum, count
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    # Контекстний менеджер для вимірювання тривалості блоку коду
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def _merged(self, labels):
+        if labels:
+            series = self._series.get(tuple(sorted(labels.items())))
+            return series or [[0] * (len(self.buckets) + 1), 0.0, 0]
+        merged = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        for counts, total, count in self._series.values():
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+        return merged
+
+    def count(self, **labels):
+        return self._merged(labels)[2]
+
+    def mean(self, **labels):
+        _, total, count = self._merged(labels)
+        return total / count if count else 0.0
+
+    # Наближений квантиль: верхня межа кошика, в який він потрапляє
+    def quantile(self, q, **labels):
+        counts, _, count = self._merged(labels)
+        if not count:
+            return 0.0
+        threshold = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            if cumulative >= threshold:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+
+
+def counter(name, help_text):
+    if name not in _metrics:
+        _metrics[name] = Counter(name, help_text)
+    return _metrics[name]
+
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    if name not in _metrics:
+        _metrics[name] = Histogram(name, help_text, buckets)
+    return _metrics[name]
+
+
+# Метрики бота
+handler_seconds = histogram("bot_handler_seconds", "Тривалість обробки оновлень")
+handler_errors = counter("bot_handler_errors_total", "Помилки в обробниках")
+telegram_request_seconds = histogram("bot_telegram_request_seconds", "Тривалість запитів до Telegram Bot API")
+telegram_requests = counter("bot_telegram_requests_total", "Запити до Telegram Bot API за результатом")
+messages = counter("bot_broadcast_messages_total", "Повідомлення розсилок за статусом")
+pixabay_request_seconds = histogram("bot_pixabay_request_seconds", "Тривалість запитів до Pixabay")
+pixabay_requests = counter("bot_pixabay_requests_total", "Запити до Pixabay за результатом")
+image_draws = counter("bot_image_draws_total", "Видачі зображень з пулу за джерелом")
+db_query_seconds = histogram("bot_db_query_seconds", "Тривалість запитів до бази даних")
+db_errors = counter("bot_db_errors_total", "Помилки запитів до бази даних")
+reactions = counter("bot_reactions_total", "Натискання кнопок реакцій за типом")
+
+
+# Текст усіх метрик у форматі Prometheus
+def render():
+    lines = []
+    for metric in _metrics.values():
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+# Окремий HTTP-сервер для метрик (у режимі polling, де немає вебхук-сервера)
+async def start_server(host, port):
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"📈 Метрики доступні на http://{host}:{port}/metrics")
+    return runner
+
+
+# Middleware для вимірювання тривалості та помилок обробників
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(handler=name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, handler=name)
+
+
+# Middleware сесії бота для вимірювання запитів до Telegram Bot API
+class TelegramRequestMetricsMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await make_request(bot, method)
+            status = "ok"
+            return response
+        except TelegramForbiddenError:
+            status = "blocked"
+            raise
+        except TelegramRetryAfter:
+            status = "retry_after"
+            raise
+        finally:
+            telegram_request_seconds.observe(time.perf_counter() - started, method=name)
+            telegram_requests.inc(method=name, status=status)
+
+
+# Короткий звіт для команди /stats
+def summary():
+    return (
+        f"📈 Обробники: {handler_seconds.count()} викликів, {handler_errors.value()} помилок, "
+        f"p50 {handler_seconds.quantile(0.5) * 1000:.0f} мс, p99 {handler_seconds.quantile(0.99) * 1000:.0f} мс\n"
+        f"📨 Розсилки: надіслано {messages.value(status='sent')}, "
+        f"помилок {messages.value(status='failed')}, заблокували {messages.value(status='blocked')}, "
+        f"помилок бота {messages.value(status='error')}\n"
+        f"✈️ Telegram API: {telegram_request_seconds.count()} запитів, "
+        f"p50 {telegram_request_seconds.quantile(0.5) * 1000:.0f} мс, "
+        f"p99 {telegram_request_seconds.quantile(0.99) * 1000:.0f} мс\n"
+        f"🖼 Pixabay: {pixabay_request_seconds.count()} запитів, "
+        f"середнє {pixabay_request_seconds.mean() * 1000:.0f} мс, помилок {pixabay_requests.value(status='error')}, "
+        f"видано з пулу {image_draws.value(source='pool')}, повторно {image_draws.value(source='recent')}, "
+        f"без зображення {image_draws.value(source='empty')}\n"
+        f"🗄 БД: {db_query_seconds.count()} запитів, середнє {db_query_seconds.mean() * 1000:.1f} мс, "
+        f"p99 {db_query_seconds.quantile(0.99) * 1000:.0f} мс, помилок {db_errors.value()}"
+    )
@@ -0,0 +1,624 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+
+import broadcast
+import db
+
+BATCH_SIZE = 100  # скільки отримувачів читати і фіксувати за один раз
+CHECKPOINT_INTERVAL = 2.0  # секунд між примусовими збереженнями прогресу
+RETENTION_DAYS = 30  # скільки днів зберігати завершені розсилки
+# Оренда розсилки: репліка, що її виконує, продовжує оренду кожні
+# LEASE_RENEW_INTERVAL секунд. Незавершену розсилку, оренду якої не
+# продовжували LEASE_TIMEOUT секунд, забирає інша репліка.
+LEASE_TIMEOUT = 90
+LEASE_RENEW_INTERVAL = 30
+
+# Статуси розсилки та остаточні статуси доставки
+PREPARING = "preparing"  # отримувачі ще записуються
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"  # зупинена адміністратором
+ABANDONED = "abandoned"  # бот зупинився до того, як записав усіх отримувачів
+FINAL_STATUSES = ("sent", "failed", "blocked", "error", "unknown")
+
+# Проміжні статуси доставки: надсилання почалося, але результат ще не
+# збережено. Після збою такі отримувачі не отримують повідомлення вдруге,
+# а їхня доставка вважається невідомою.
+SENDING = "sending"
+UNKNOWN = "unknown"
+
+
+# Перебір звичайного або асинхронного ітератора
+async def _iterate(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+# Сховище черги розсилок у PostgreSQL (через пул з db.py)
+class PostgresOutboxStore:
+    async def init(self):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id SERIAL PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                finished_at TIMESTAMPTZ
+            )
+        ''')
+        # Репліка, яка створила розсилку і відповідає за її продовження
+        await db.execute('ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS owner TEXT')
+        await db.execute('ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS lease_until TIMESTAMPTZ')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+                user_id BIGINT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (broadcast_id, user_id)
+            )
+        ''')
+
+    async def create(self, kind, payload, owner=None):
+        return await db.fetchval('''
+            INSERT INTO broadcasts (kind, payload, status, owner, lease_until)
+            VALUES ($1, $2, $3, $4, now() + make_interval(secs => $5))
+            RETURNING id
+        ''', kind, payload, PREPARING, owner, LEASE_TIMEOUT)
+
+    # Продовження оренди розсилки (False, якщо її вже забрала інша репліка)
+    async def renew(self, broadcast_id, owner=None):
+        renewed = await db.fetchval('''
+            UPDATE broadcasts SET lease_until = now() + make_interval(secs => $3)
+            WHERE id = $1 AND owner IS NOT DISTINCT FROM $2
+            RETURNING id
+        ''', broadcast_id, owner, LEASE_TIMEOUT)
+        return renewed is not None
+
+    async def add_recipients(self, broadcast_id, user_ids):
+        await db.execute('''
+            INSERT INTO broadcast_deliveries (broadcast_id, user_id)
+            SELECT $1, unnest($2::bigint[])
+            ON CONFLICT DO NOTHING
+        ''', broadcast_id, user_ids)
+
+    async def pending_batch(self, broadcast_id, after_user_id, limit):
+        rows = await db.fetch('''
+            SELECT user_id FROM broadcast_deliveries
+            WHERE broadcast_id = $1 AND status = 'pending' AND user_id > $2
+            ORDER BY user_id
+            LIMIT $3
+        ''', broadcast_id, after_user_id, limit)
+        return [row['user_id'] for row in rows]
+
+    # Позначення отримувача SENDING (False, якщо він уже не очікує надсилання)
+    async def mark_sending(self, broadcast_id, user_id):
+        marked = await db.fetchval('''
+            UPDATE broadcast_deliveries SET status = $3, updated_at = now()
+            WHERE broadcast_id = $1 AND user_id = $2 AND status = 'pending'
+            RETURNING user_id
+        ''', broadcast_id, user_id, SENDING)
+        return marked is not None
+
+    # Отримувачі, надсилання яким почалося, але не було збережене, стають UNKNOWN
+    async def settle_sending(self, broadcast_id):
+        status = await db.execute('''
+            UPDATE broadcast_deliveries SET status = $3, updated_at = now()
+            WHERE broadcast_id = $1 AND status = $2
+        ''', broadcast_id, SENDING, UNKNOWN)
+        return int(status.split()[-1])
+
+    async def checkpoint(self, broadcast_id, results):
+        await db.execute('''
+            UPDATE broadcast_deliveries AS d
+            SET status = r.status, updated_at = now()
+            FROM unnest($2::bigint[], $3::text[]) AS r(user_id, status)
+            WHERE d.broadcast_id = $1 AND d.user_id = r.user_id
+        ''', broadcast_id, [user_id for user_id, _ in results], [status for _, status in results])
+
+    async def set_status(self, broadcast_id, status):
+        finished = status != RUNNING
+        await db.execute('''
+            UPDATE broadcasts
+            SET status = $2, finished_at = CASE WHEN $3 THEN now() ELSE finished_at END
+            WHERE id = $1
+        ''', broadcast_id, status, finished)
+
+    async def get_status(self, broadcast_id):
+        return await db.fetchval('SELECT status FROM broadcasts WHERE id = $1', broadcast_id)
+
+    # Скасування незавершеної розсилки (True, якщо статус змінено)
+    async def cancel(self, broadcast_id):
+        cancelled = await db.fetchval('''
+            UPDATE broadcasts SET status = $2, finished_at = now()
+            WHERE id = $1 AND status IN ('preparing', 'running')
+            RETURNING id
+        ''', broadcast_id, CANCELLED)
+        return cancelled is not None
+
+    # Незавершені розсилки, які має продовжити репліка owner: власні (якщо own),
+    # без власника та ті, чия оренда спливла (репліка зупинилася і не
+    # повернулася). Знайдені розсилки атомарно закріплюються за owner.
+    async def unfinished(self, owner=None, own=True):
+        return await db.fetch('''
+            UPDATE broadcasts SET owner = $1, lease_until = now() + make_interval(secs => $3)
+            WHERE status IN ('preparing', 'running')
+                AND (owner IS NULL OR ($2 AND owner = $1) OR lease_until IS NULL OR lease_until < now())
+            RETURNING id, kind, payload, status
+        ''', owner, own, LEASE_TIMEOUT)
+
+    async def recent(self, limit):
+        return await db.fetch('''
+            SELECT id, kind, status, created_at FROM broadcasts
+            ORDER BY id DESC
+            LIMIT $1
+        ''', limit)
+
+    async def progress(self, broadcast_id):
+        rows = await db.fetch('''
+            SELECT status, count(*) AS count FROM broadcast_deliveries
+            WHERE broadcast_id = $1
+            GROUP BY status
+        ''', broadcast_id)
+        return {row['status']: row['count'] for row in rows}
+
+    # Видалення розсилок, завершених понад days днів тому (разом з отримувачами)
+    async def prune(self, days):
+        status = await db.execute('''
+            DELETE FROM broadcasts
+            WHERE status NOT IN ('preparing', 'running') AND finished_at < now() - make_interval(days => $1)
+        ''', days)
+        return int(status.split()[-1])
+
+    async def close(self):
+        pass
+
+
+# Сховище черги розсилок у SQLite — локальна заміна PostgreSQL для тестів.
+# Запити виконуються в окремому потоці, щоб не блокувати цикл подій.
+class SQLiteOutboxStore:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = asyncio.Lock()
+
+    async def _run(self, fn, *args):
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+
+    def _init(self):
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS broadcasts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                finished_at TEXT,
+                owner TEXT,
+                lease_until TEXT
+            );
+            CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+                broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (broadcast_id, user_id)
+            );
+        ''')
+        columns = [row['name'] for row in self._conn.execute('PRAGMA table_info(broadcasts)')]
+        if 'owner' not in columns:
+            self._conn.execute('ALTER TABLE broadcasts ADD COLUMN owner TEXT')
+        if 'lease_until' not in columns:
+            self._conn.execute('ALTER TABLE broadcasts ADD COLUMN lease_until TEXT')
+
+    async def init(self):
+        await self._run(self._init)
+
+    def _create(self, kind, payload, owner):
+        with self._conn:
+            cursor = self._conn.execute('''
+                INSERT INTO broadcasts (kind, payload, status, owner, lease_until)
+                VALUES (?, ?, ?, ?, datetime('now', ?))
+            ''', (kind, payload, PREPARING, owner, f'+{LEASE_TIMEOUT} seconds'))
+        return cursor.lastrowid
+
+    async def create(self, kind, payload, owner=None):
+        return await self._run(self._create, kind, payload, owner)
+
+    def _renew(self, broadcast_id, owner):
+        with self._conn:
+            cursor = self._conn.execute('''
+                UPDATE broadcasts SET lease_until = datetime('now', ?)
+                WHERE id = ? AND owner IS ?
+            ''', (f'+{LEASE_TIMEOUT} seconds', broadcast_id, owner))
+        return cursor.rowcount > 0
+
+    async def renew(self, broadcast_id, owner=None):
+        return await self._run(self._renew, broadcast_id, owner)
+
+    def _add_recipients(self, broadcast_id, user_ids):
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO broadcast_deliveries (broadcast_id, user_id) VALUES (?, ?)',
+                ((broadcast_id, user_id) for user_id in user_ids),
+            )
+
+    async def add_recipients(self, broadcast_id, user_ids):
+        await self._run(self._add_recipients, broadcast_id, user_ids)
+
+    def _pending_batch(self, broadcast_id, after_user_id, limit):
+        rows = self._conn.execute('''
+            SELECT user_id FROM broadcast_deliveries
+            WHERE broadcast_id = ? AND status = 'pending' AND user_id > ?
+            ORDER BY user_id
+            LIMIT ?
+        ''', (broadcast_id, after_user_id, limit)).fetchall()
+        return [row['user_id'] for row in rows]
+
+    async def pending_batch(self, broadcast_id, after_user_id, limit):
+        return await self._run(self._pending_batch, broadcast_id, after_user_id, limit)
+
+    def _mark_sending(self, broadcast_id, user_id):
+        with self._conn:
+            cursor = self._conn.execute('''
+                UPDATE broadcast_deliveries SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE broadcast_id = ? AND user_id = ? AND status = 'pending'
+            ''', (SENDING, broadcast_id, user_id))
+        return cursor.rowcount > 0
+
+    async def mark_sending(self, broadcast_id, user_id):
+        return await self._run(self._mark_sending, broadcast_id, user_id)
+
+    def _settle_sending(self, broadcast_id):
+        with self._conn:
+            cursor = self._conn.execute('''
+                UPDATE broadcast_deliveries SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE broadcast_id = ? AND status = ?
+            ''', (UNKNOWN, broadcast_id, SENDING))
+        return cursor.rowcount
+
+    async def settle_sending(self, broadcast_id):
+        return await self._run(self._settle_sending, broadcast_id)
+
+    def _checkpoint(self, broadcast_id, results):
+        with self._conn:
+            self._conn.executemany('''
+                UPDATE broadcast_deliveries SET status = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE broadcast_id = ? AND user_id = ?
+            ''', ((status, broadcast_id, user_id) for user_id, status in results))
+
+    async def checkpoint(self, broadcast_id, results):
+        await self._run(self._checkpoint, broadcast_id, results)
+
+    def _execute(self, query, args=()):
+        with self._conn:
+            return [dict(row) for row in self._conn.execute(query, args).fetchall()]
+
+    async def set_status(self, broadcast_id, status):
+        finished = status != RUNNING
+        await self._run(self._execute, '''
+            UPDATE broadcasts
+            SET status = ?, finished_at = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE finished_at END
+            WHERE id = ?
+        ''', (status, finished, broadcast_id))
+
+    async def get_status(self, broadcast_id):
+        rows = await self._run(self._execute, 'SELECT status FROM broadcasts WHERE id = ?', (broadcast_id,))
+        return rows[0]['status'] if rows else None
+
+    def _cancel(self, broadcast_id):
+        with self._conn:
+            cursor = self._conn.execute('''
+                UPDATE broadcasts SET status = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('preparing', 'running')
+            ''', (CANCELLED, broadcast_id))
+        return cursor.rowcount > 0
+
+    async def cancel(self, broadcast_id):
+        return await self._run(self._cancel, broadcast_id)
+
+    async def unfinished(self, owner=None, own=True):
+        return await self._run(self._execute, '''
+            UPDATE broadcasts SET owner = ?, lease_until = datetime('now', ?)
+            WHERE status IN ('preparing', 'running')
+                AND (owner IS NULL OR (? AND owner = ?) OR lease_until IS NULL OR lease_until < datetime('now'))
+            RETURNING id, kind, payload, status
+        ''', (owner, f'+{LEASE_TIMEOUT} seconds', own, owner))
+
+    async def recent(self, limit):
+        return await self._run(
+            self._execute, 'SELECT id, kind, status, created_at FROM broadcasts ORDER BY id DESC LIMIT ?', (limit,)
+        )
+
+    async def progress(self, broadcast_id):
+        rows = await self._run(self._execute, '''
+            SELECT status, count(*) AS count FROM broadcast_deliveries
+            WHERE broadcast_id = ?
+            GROUP BY status
+        ''', (broadcast_id,))
+        return {row['status']: row['count'] for row in rows}
+
+    # Зовнішні ключі в SQLite за замовчуванням вимкнені, тож отримувачі видаляються окремо
+    def _prune(self, days):
+        finished = '''
+            SELECT id FROM broadcasts
+            WHERE status NOT IN ('preparing', 'running') AND finished_at < datetime('now', ?)
+        '''
+        with self._conn:
+            self._conn.execute(f'DELETE FROM broadcast_deliveries WHERE broadcast_id IN ({finished})', (f'-{days} days',))
+            cursor = self._conn.execute(f'DELETE FROM broadcasts WHERE id IN ({finished})', (f'-{days} days',))
+        return cursor.rowcount
+
+    async def prune(self, days):
+        return await self._run(self._prune, days)
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+
+
+# Черга розсилок: кожна розсилка і кожен її отримувач записуються в базу,
+# прогрес фіксується пакетами, а незавершені розсилки продовжуються після
+# перезапуску бота з того місця, де зупинилися. Розсилку, чия репліка так і
+# не повернулася, після закінчення оренди продовжує інша репліка.
+class Outbox:
+    def __init__(self, store, batch_size=BATCH_SIZE, owner=None, on_checkpoint=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.owner = owner  # ідентифікатор репліки, що орендує свої розсилки
+        self.on_checkpoint = on_checkpoint  # корутина on_checkpoint(results) після кожного збереження
+        self._senders = {}  # kind -> make_send(payload)
+        self._limiters = {}  # kind -> власний обмежувач швидкості
+        self._tasks = {}  # broadcast_id -> фонове завдання продовження
+        self._running = {}  # broadcast_id -> завдання, що зараз виконує розсилку
+        self._runners = {}  # broadcast_id -> завдання, що викликало run() і зберігає прогрес
+        self._cancelled = set()  # розсилки, скасовані в цьому процесі
+
+    # Реєстрація типу розсилки: make_send(payload) повертає корутину send(chat_id).
+    # limiter — необов'язковий обмежувач швидкості для всіх розсилок цього типу.
+    def register(self, kind, make_send, limiter=None):
+        self._senders[kind] = make_send
+        if limiter is not None:
+            self._limiters[kind] = limiter
+
+    async def init(self):
+        await self.store.init()
+
+    # Продовження незавершених розсилок у фоні. При старті бота продовжуються
+    # і власні розсилки, а періодичний виклик з takeover_only=True лише
+    # забирає розсилки, оренда яких спливла.
+    async def resume(self, takeover_only=False):
+        rows = await self.store.unfinished(self.owner, own=not takeover_only)
+        for row in sorted(rows, key=lambda row: row['id']):
+            if row['id'] in self._tasks or row['id'] in self._runners:
+                continue
+            if row['status'] == PREPARING:
+                logging.warning(f"⚠️ Розсилку #{row['id']} не було підготовлено до кінця, скасовую.")
+                await self.store.set_status(row['id'], ABANDONED)
+                continue
+            if row['kind'] not in self._senders:
+                logging.warning(f"⚠️ Невідомий тип розсилки {row['kind']} (#{row['id']}), пропускаю.")
+                continue
+            logging.info(f"🔁 Продовжую незавершену розсилку #{row['id']} ({row['kind']}).")
+            self._start_task(row['id'], row['kind'], json.loads(row['payload']))
+
+    def _start_task(self, broadcast_id, kind, payload):
+        self._tasks[broadcast_id] = asyncio.create_task(self._run_task(broadcast_id, kind, payload))
+
+    async def _run_task(self, broadcast_id, kind, payload):
+        try:
+            await self.run(broadcast_id, kind, payload)
+        except Exception as e:
+            logging.error(f"Помилка при виконанні розсилки #{broadcast_id}: {e}")
+        finally:
+            self._tasks.pop(broadcast_id, None)
+
+    # Зупинка: розсилкам дається timeout секунд на завершення, після чого вони
+    # скасовуються (прогрес зберігається і розсилка продовжиться після старту)
+    async def close(self, timeout=0):
+        tasks = set(self._tasks.values()) | set(self._running.values()) | set(self._runners.values())
+        if tasks and timeout:
+            await asyncio.wait(tasks, timeout=timeout)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+
+    # Створення розсилки та запис усіх отримувачів.
+    # user_ids — звичайний або асинхронний ітератор, записується пакетами.
+    async def submit(self, kind, payload, user_ids):
+        broadcast_id = await self.store.create(kind, json.dumps(payload), self.owner)
+        renewed = time.monotonic()
+        batch = []
+        async for user_id in _iterate(user_ids):
+            batch.append(user_id)
+            if len(batch) >= self.batch_size:
+                await self.store.add_recipients(broadcast_id, batch)
+                batch = []
+                if time.monotonic() - renewed >= LEASE_RENEW_INTERVAL:
+                    await self.store.renew(broadcast_id, self.owner)
+                    renewed = time.monotonic()
+        if batch:
+            await self.store.add_recipients(broadcast_id, batch)
+        await self.store.set_status(broadcast_id, RUNNING)
+        logging.info(f"📝 Створено розсилку #{broadcast_id} ({kind}).")
+        return broadcast_id
+
+    # Видалення старих завершених розсилок (викликається планувальником раз на добу)
+    async def prune(self, days=RETENTION_DAYS):
+        deleted = await self.store.prune(days)
+        if deleted:
+            logging.info(f"🧹 Видалено {deleted} розсилок, завершених понад {days} днів тому.")
+        return deleted
+
+    # Кількість отримувачів розсилки
+    async def total(self, broadcast_id):
+        return sum((await self.store.progress(broadcast_id)).values())
+
+    # Створення розсилки та її виконання у фоні (повертає id розсилки)
+    async def start(self, kind, payload, user_ids):
+        broadcast_id = await self.submit(kind, payload, user_ids)
+        self._start_task(broadcast_id, kind, payload)
+        return broadcast_id
+
+    # Створення розсилки та її негайне виконання
+    async def send(self, kind, payload, user_ids, on_result=None):
+        broadcast_id = await self.submit(kind, payload, user_ids)
+        return await self.run(broadcast_id, kind, payload, on_result=on_result)
+
+    # Скасування розсилки: надсилання зупиняється, уже надіслане зберігається.
+    # Розсилку в іншому процесі зупиняє перевірка статусу перед кожним пакетом.
+    async def cancel(self, broadcast_id):
+        if not await self.store.cancel(broadcast_id):
+            return False
+        task = self._running.get(broadcast_id)
+        if task is not None:
+            self._cancelled.add(broadcast_id)
+            task.cancel()
+        logging.info(f"⛔ Розсилку #{broadcast_id} скасовано.")
+        return True
+
+    # Надсилання всім отримувачам розсилки, які ще не отримали повідомлення.
+    # Перед надсиланням отримувач позначається SENDING, тож після збою тим,
+    # кому повідомлення могло вже надійти, воно не надсилається вдруге.
+    # on_result — необов'язкова корутина on_result(chat_id, status) для стеження за прогресом.
+    async def run(self, broadcast_id, kind, payload, on_result=None):
+        make_send = self._senders[kind](payload)
+        results = []
+        last_checkpoint = time.monotonic()
+        checkpoint_lock = asyncio.Lock()
+        partial = broadcast.BroadcastResult()  # підсумок на випадок скасування
+        claimed = set()  # отримувачі, позначені SENDING і ще без результату
+        stopped = False
+        started = time.monotonic()
+
+        async def flush():
+            nonlocal results, last_checkpoint
+            async with checkpoint_lock:
+                batch, results = results, []
+                last_checkpoint = time.monotonic()
+                if batch:
+                    try:
+                        await self.store.checkpoint(broadcast_id, batch)
+                    except BaseException:
+                        # Перерване збереження (зупинка бота) повторить наступний flush
+                        results = batch + results
+                        raise
+                    if self.on_checkpoint is not None:
+                        try:
+                            await self.on_checkpoint(batch)
+                        except Exception as e:
+                            logging.error(f"Помилка при обробці результатів розсилки #{broadcast_id}: {e}")
+
+        async def record(chat_id, status):
+            claimed.discard(chat_id)
+            setattr(partial, status, getattr(partial, status) + 1)
+            if status == "blocked":
+                partial.blocked_ids.append(chat_id)
+            results.append((chat_id, status))
+            if on_result is not None:
+                await on_result(chat_id, status)
+            if len(results) >= self.batch_size or time.monotonic() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                await flush()
+
+        # Отримувач позначається SENDING лише перед першою спробою. Якщо
+        # позначити не вдалося, його вже обробляє інша репліка, що забрала розсилку.
+        async def send(chat_id):
+            if chat_id not in claimed:
+                if not await self.store.mark_sending(broadcast_id, chat_id):
+                    raise broadcast.SkipRecipient()
+                claimed.add(chat_id)
+            await make_send(chat_id)
+
+        async def settle():
+            uncertain = await self.store.settle_sending(broadcast_id)
+            if uncertain:
+                logging.warning(
+                    f"⚠️ Розсилка #{broadcast_id}: доставка {uncertain} повідомлень невідома, повторно не надсилаю."
+                )
+
+        async def recipients():
+            nonlocal stopped
+            after_user_id = -2 ** 63
+            while True:
+                if await self.store.get_status(broadcast_id) == CANCELLED:
+                    stopped = True
+                    return
+                batch = await self.store.pending_batch(broadcast_id, after_user_id, self.batch_size)
+                if not batch:
+                    return
+                for user_id in batch:
+                    yield user_id
+                after_user_id = batch[-1]
+
+        # Продовження оренди; якщо розсилку вже забрала інша репліка, надсилання зупиняється
+        async def keep_lease():
+            nonlocal lease_lost
+            while True:
+                await asyncio.sleep(LEASE_RENEW_INTERVAL)
+                try:
+                    renewed = await self.store.renew(broadcast_id, self.owner)
+                except Exception as e:
+                    logging.error(f"Не вдалося продовжити оренду розсилки #{broadcast_id}: {e}")
+                    continue
+                if not renewed:
+                    lease_lost = True
+                    task.cancel()
+                    return
+
+        await settle()  # надсилання, перервані попереднім запуском
+        task = asyncio.create_task(
+            broadcast.broadcast(recipients(), send, limiter=self._limiters.get(kind), on_result=record)
+        )
+        lease_lost = False
+        lease = asyncio.create_task(keep_lease())
+        self._running[broadcast_id] = task
+        self._runners[broadcast_id] = asyncio.current_task()
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            if lease_lost and not asyncio.current_task().cancelling():
+                raise RuntimeError(f"розсилку #{broadcast_id} продовжує інша репліка")
+            # Зупинка бота (а не скасування розсилки) — прогрес збережено, розсилка продовжиться
+            if broadcast_id not in self._cancelled or asyncio.current_task().cancelling():
+                raise
+            stopped = True
+            result = partial
+            result.duration = time.monotonic() - started
+        finally:
+            lease.cancel()
+            self._running.pop(broadcast_id, None)
+            self._runners.pop(broadcast_id, None)
+            self._cancelled.discard(broadcast_id)
+            await flush()
+        result.cancelled = stopped
+        await settle()  # перервані надсилання (скасування або репліка, що втратила оренду)
+        if not stopped:
+            await self.store.set_status(broadcast_id, DONE)
+        return result
+
+    # Короткий звіт про останні розсилки для адміністратора
+    async def report(self, limit=5):
+        lines = []
+        for row in await self.store.recent(limit):
+            counts = await self.store.progress(row['id'])
+            total = sum(counts.values())
+            done = sum(counts.get(status, 0) for status in FINAL_STATUSES)
+            lines.append(
+                f"#{row['id']} {row['kind']} ({row['status']}): {done}/{total} — "
+                f"✅ {counts.get('sent', 0)}, ⚠️ {counts.get('failed', 0)}, 🚫 {counts.get('blocked', 0)}, "
+                f"🛠 {counts.get('error', 0)}, ❔ {counts.get(UNKNOWN, 0)}"
+            )
+        return "\n".join(lines)
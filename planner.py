@@ -0,0 +1,159 @@
+import logging
+from datetime import time
+
+import asyncpg
+import pytz
+
+import db
+
+# Параметри вікна щоденної розсилки (час — за часовим поясом бота)
+WINDOW_START = time(18, 0)
+WINDOW_MINUTES = 60  # тривалість вікна, протягом якого розподіляються користувачі
+DELIVERY_RATE = 10  # повідомлень на секунду для щоденної розсилки
+PAGE_SIZE = 1000
+
+# Хвилина доби (за часовим поясом бота), коли користувач отримує розсилку.
+# Місцевий час користувача — це його delivery_time або стабільний слот у вікні
+# (за хешем user_id), переведений з його timezone у часовий пояс бота.
+# Параметри: $1 — часовий пояс бота, $2 — початок вікна, $3 — тривалість вікна;
+# {time} і {zone} — вирази з власним часом і часовим поясом користувача.
+_SLOT_FOR = '''floor(extract(epoch FROM (
+    (
+        (now() AT TIME ZONE coalesce({zone}, $1))::date
+        + coalesce({time}, $2::time + ((hashint8(user_id) & 2147483647) % $3) * interval '1 minute')
+    ) AT TIME ZONE coalesce({zone}, $1) AT TIME ZONE $1
+)::time) / 60)::int'''
+_SLOT = _SLOT_FOR.format(time="delivery_time", zone="timezone")
+
+
+# Планувальник доставки: кожен користувач має власну хвилину розсилки
+# (users.delivery_minute), тож розсилка розподіляється по вікну, а не
+# надсилається всім одночасно. Слот залежить лише від самого користувача,
+# тому додавання чи видалення інших користувачів його не змінює.
+class DeliveryPlanner:
+    def __init__(self, tz, window_start=WINDOW_START, window_minutes=WINDOW_MINUTES, rate=DELIVERY_RATE):
+        self.tz = tz
+        self.window_start = window_start
+        self.window_minutes = max(1, window_minutes)
+        self.rate = rate
+
+    @property
+    def _params(self):
+        return self.tz.zone, self.window_start, self.window_minutes
+
+    async def init(self):
+        await db.execute('''
+            ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS delivery_time TIME,
+                ADD COLUMN IF NOT EXISTS timezone TEXT,
+                ADD COLUMN IF NOT EXISTS delivery_minute SMALLINT
+        ''')
+        # Розсилка читає лише активних користувачів, тож індекс частковий
+        await db.execute('DROP INDEX IF EXISTS users_delivery_minute_idx')
+        await db.execute(
+            'CREATE INDEX IF NOT EXISTS users_active_delivery_idx ON users (delivery_minute, user_id) WHERE active'
+        )
+        # Часові пояси, збережені до перевірки в PostgreSQL, але невідомі йому,
+        # зупинили б перерахунок слотів — такі користувачі повертаються до поясу бота
+        status = await db.execute('''
+            UPDATE users SET timezone = NULL
+            WHERE timezone IS NOT NULL AND timezone NOT IN (SELECT name FROM pg_timezone_names)
+        ''')
+        reset = int(status.split()[-1])
+        if reset:
+            logging.warning(f"⚠️ Скинуто невідомі PostgreSQL часові пояси для {reset} користувачів.")
+        await self.recompute()
+
+    # Перерахунок слотів. Оновлюються лише рядки, чий слот змінився: нові
+    # користувачі, зміна параметрів вікна або переходи на літній/зимовий час
+    # у часових поясах користувачів.
+    async def recompute(self, only_custom=False):
+        condition = "AND (delivery_time IS NOT NULL OR timezone IS NOT NULL)" if only_custom else ""
+        status = await db.execute(f'''
+            UPDATE users SET delivery_minute = {_SLOT}
+            WHERE delivery_minute IS DISTINCT FROM {_SLOT} {condition}
+        ''', *self._params)
+        updated = int(status.split()[-1])
+        if updated:
+            logging.info(f"🗓 Оновлено слоти доставки для {updated} користувачів.")
+        await self._check_capacity()
+        return updated
+
+    # Слот для одного (нового) користувача
+    async def assign(self, user_id):
+        await self.assign_many([user_id])
+
+    # Слоти для групи нових користувачів (наприклад, після імпорту)
+    async def assign_many(self, user_ids):
+        await db.execute(
+            f'UPDATE users SET delivery_minute = {_SLOT} WHERE user_id = ANY($4::bigint[])', *self._params, user_ids
+        )
+
+    # Власний час і часовий пояс користувача (None — слот у загальному вікні).
+    # Уподобання і слот записуються одним запитом, тож часовий пояс, який
+    # не приймає PostgreSQL, не зберігається (pytz.UnknownTimeZoneError).
+    async def set_preference(self, user_id, delivery_time=None, timezone=None):
+        slot = _SLOT_FOR.format(time="$5::time", zone="$6::text")
+        try:
+            await db.execute(
+                f'UPDATE users SET delivery_time = $5, timezone = $6, delivery_minute = {slot} WHERE user_id = $4',
+                *self._params, user_id, delivery_time, timezone
+            )
+        except asyncpg.InvalidParameterValueError:
+            raise pytz.UnknownTimeZoneError(timezone)
+
+    async def has_due(self, minute, shard=None):
+        return bool(await self._due_page(minute, -2 ** 63, 1, shard))
+
+    # Хвилини доби до until включно, на які припадає розсилка хоча б одному активному користувачу
+    async def due_minutes(self, until):
+        rows = await db.fetch('''
+            SELECT DISTINCT delivery_minute FROM users
+            WHERE active AND delivery_minute <= $1
+            ORDER BY delivery_minute
+        ''', until)
+        return [row['delivery_minute'] for row in rows]
+
+    # Потоковий перебір активних користувачів, яким розсилка належить у хвилину minute
+    async def iter_due_user_ids(self, minute, shard=None):
+        after_user_id = -2 ** 63
+        while True:
+            batch = await self._due_page(minute, after_user_id, PAGE_SIZE, shard)
+            if not batch:
+                return
+            for row in batch:
+                yield row['user_id']
+            after_user_id = batch[-1]['user_id']
+
+    async def _due_page(self, minute, after_user_id, limit, shard):
+        if shard is None:
+            return await db.fetch('''
+                SELECT user_id FROM users
+                WHERE delivery_minute = $1 AND active AND user_id > $2
+                ORDER BY user_id
+                LIMIT $3
+            ''', minute, after_user_id, limit)
+        index, count = shard
+        return await db.fetch('''
+            SELECT user_id FROM users
+            WHERE delivery_minute = $1 AND active AND user_id > $2 AND (hashint8(user_id) & 2147483647) % $5 = $4
+            ORDER BY user_id
+            LIMIT $3
+        ''', minute, after_user_id, limit, index, count)
+
+    # Попередження, якщо в найзавантаженішу хвилину користувачів більше,
+    # ніж встигає надіслати розсилка з темпом rate
+    async def _check_capacity(self):
+        row = await db.fetchrow('''
+            SELECT delivery_minute, count(*) AS count FROM users
+            WHERE active
+            GROUP BY delivery_minute
+            ORDER BY count DESC
+            LIMIT 1
+        ''')
+        if row and row['count'] > self.rate * 60:
+            logging.warning(
+                f"⚠️ На хвилину {row['delivery_minute'] // 60:02d}:{row['delivery_minute'] % 60:02d} "
+                f"припадає {row['count']} користувачів — більше, ніж {self.rate * 60} за хвилину. "
+                f"Збільшіть DELIVERY_WINDOW_MINUTES або DELIVERY_RATE."
+            )
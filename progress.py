@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+UPDATE_INTERVAL = 3.0  # секунд між оновленнями повідомлення з прогресом
+EDIT_ATTEMPTS = 3  # спроб відредагувати повідомлення після TelegramRetryAfter
+
+CANCEL_PREFIX = "outbox:cancel:"
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+# Повідомлення адміністратору з прогресом розсилки: періодично редагується
+# (надіслано, помилки, швидкість, залишок часу) і має кнопку скасування
+class BroadcastProgress:
+    def __init__(self, bot, chat_id, broadcast_id, total, interval=UPDATE_INTERVAL):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.broadcast_id = broadcast_id
+        self.total = total
+        self.interval = interval
+        self.counts = {"sent": 0, "failed": 0, "blocked": 0, "error": 0}
+        self.message = None
+        self._started = None
+        self._task = None
+        self._last_text = None
+
+    async def start(self):
+        self._started = time.monotonic()
+        self._last_text = self._text()
+        self.message = await self.bot.send_message(self.chat_id, self._last_text, reply_markup=self._keyboard())
+        self._task = asyncio.create_task(self._update_loop())
+
+    # Результат доставки одному отримувачу (передається в outbox.run)
+    async def on_result(self, chat_id, status):
+        self.counts[status] = self.counts.get(status, 0) + 1
+
+    # Остаточний підсумок замість прогресу (кнопка скасування прибирається).
+    # result=None — розсилку перервала помилка або зупинка бота; її прогрес
+    # збережено, і вона продовжиться після перезапуску.
+    async def finish(self, result):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if result is None:
+            text = f"⚠️ Розсилку #{self.broadcast_id} перервано, вона продовжиться після перезапуску бота."
+        else:
+            text = f"📬 Розсилку #{self.broadcast_id} завершено.\n{result.summary()}"
+        await self._edit(text, reply_markup=None)
+
+    def _keyboard(self):
+        return InlineKeyboardMarkup(inline_keyboard=[[
+            InlineKeyboardButton(text="⛔ Скасувати", callback_data=f"{CANCEL_PREFIX}{self.broadcast_id}"),
+        ]])
+
+    def _text(self):
+        done = sum(self.counts.values())
+        elapsed = time.monotonic() - self._started
+        rate = done / elapsed if elapsed else 0.0
+        eta = _format_duration((self.total - done) / rate) if rate else "—"
+        return (
+            f"📤 Розсилка #{self.broadcast_id}: {done}/{self.total}\n"
+            f"✅ Надіслано: {self.counts['sent']}\n"
+            f"⚠️ Помилок: {self.counts['failed']}\n"
+            f"🚫 Заблокували бота: {self.counts['blocked']}\n"
+            f"🛠 Помилок бота: {self.counts['error']}\n"
+            f"⚡ {rate:.1f} повід./с, залишилось ~{eta}"
+        )
+
+    async def _update_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            text = self._text()
+            if text != self._last_text:
+                self._last_text = text
+                await self._edit(text, reply_markup=self._keyboard())
+
+    async def _edit(self, text, reply_markup):
+        for _ in range(EDIT_ATTEMPTS):
+            try:
+                await self.message.edit_text(text, reply_markup=reply_markup)
+            except TelegramRetryAfter as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except TelegramBadRequest as e:
+                if "message is not modified" not in e.message:
+                    logging.warning(f"⚠️ Не вдалося оновити прогрес розсилки #{self.broadcast_id}: {e}")
+            except TelegramAPIError as e:
+                logging.warning(f"⚠️ Не вдалося оновити прогрес розсилки #{self.broadcast_id}: {e}")
+            return
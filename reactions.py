@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import db
+import metrics
+
+FLUSH_SIZE = 200  # подій у буфері, після яких запис відбувається негайно
+FLUSH_INTERVAL = 5.0  # секунд між записами буфера
+MAX_BUFFER = 20000  # подій, які зберігаються в пам'яті, поки база недоступна
+
+LIKE = "like"
+NEW_PHOTO = "new_photo"
+
+# Колонка зведеної таблиці для кожного типу реакції
+_STAT_COLUMNS = {LIKE: "likes", NEW_PHOTO: "refreshes"}
+
+
+# Конвеєр реакцій: натискання кнопок накопичуються в пам'яті і записуються
+# в базу пакетами — за розміром буфера або за часом, тож обробник кнопки
+# не чекає на базу. Разом із сирими подіями оновлюється зведена таблиця
+# reaction_stats (лічильники для кожного зображення і кожного підпису).
+class ReactionPipeline:
+    def __init__(self, flush_size=FLUSH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._flush_lock = asyncio.Lock()
+
+    async def init(self):
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS reactions (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                kind TEXT NOT NULL,
+                image_id BIGINT,
+                caption_id INTEGER,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        ''')
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS reaction_stats (
+                dimension TEXT NOT NULL,
+                key BIGINT NOT NULL,
+                likes BIGINT NOT NULL DEFAULT 0,
+                refreshes BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, key)
+            )
+        ''')
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    # Зупинка фонового запису із записом залишку буфера
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # Реєстрація реакції (без звернення до бази)
+    def record(self, user_id, kind, image_id=None, caption_id=None):
+        if len(self._buffer) >= MAX_BUFFER:
+            self._buffer.pop(0)
+        self._buffer.append((user_id, kind, image_id, caption_id, datetime.now(timezone.utc)))
+        metrics.reactions.inc(kind=kind)
+        if len(self._buffer) >= self.flush_size:
+            self._wakeup.set()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    # Запис буфера: сирі події через COPY і зведені лічильники одним
+    # upsert-запитом — в одній транзакції. Якщо запис не вдався, події
+    # повертаються в буфер і будуть записані наступного разу.
+    async def flush(self):
+        async with self._flush_lock:
+            events, self._buffer = self._buffer, []
+            if not events:
+                return
+            try:
+                async with db.transaction() as conn:
+                    await conn.copy_records_to_table(
+                        'reactions',
+                        records=events,
+                        columns=('user_id', 'kind', 'image_id', 'caption_id', 'created_at'),
+                    )
+                    await conn.executemany('''
+                        INSERT INTO reaction_stats (dimension, key, likes, refreshes)
+                        VALUES ($1, $2, $3, $4)
+                        ON CONFLICT (dimension, key) DO UPDATE SET
+                            likes = reaction_stats.likes + EXCLUDED.likes,
+                            refreshes = reaction_stats.refreshes + EXCLUDED.refreshes
+                    ''', _rollup(events))
+            except Exception as e:
+                logging.error(f"Помилка при записі {len(events)} реакцій: {e}")
+                self._buffer = (events + self._buffer)[-MAX_BUFFER:]
+                return
+            logging.info(f"💾 Записано {len(events)} реакцій.")
+
+    # Найпопулярніші зображення або підписи зі зведеної таблиці
+    async def top(self, dimension, limit=5):
+        return await db.fetch('''
+            SELECT key, likes, refreshes FROM reaction_stats
+            WHERE dimension = $1
+            ORDER BY likes DESC, refreshes
+            LIMIT $2
+        ''', dimension, limit)
+
+
+# Агрегування пакета подій у рядки (dimension, key, likes, refreshes)
+def _rollup(events):
+    totals = {}
+    for _, kind, image_id, caption_id, _ in events:
+        column = _STAT_COLUMNS.get(kind)
+        if column is None:
+            continue
+        for dimension, key in (("image", image_id), ("caption", caption_id)):
+            if key is None:
+                continue
+            counts = totals.setdefault((dimension, key), {"likes": 0, "refreshes": 0})
+            counts[column] += 1
+    return [(dimension, key, counts["likes"], counts["refreshes"]) for (dimension, key), counts in totals.items()]
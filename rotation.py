@@ -0,0 +1,126 @@
+import random
+import zlib
+from collections import deque
+from math import gcd
+
+import db
+
+RECENT_IMAGES = 30  # скільки останніх зображень пам'ятати для кожного користувача
+
+
+# Незмінний каталог (наприклад, підписів) з перестановками без повторів.
+# Для кожного користувача і кожного проходу каталогу перестановка задається
+# формулою (step * offset + shift) % size, де step взаємно простий з size,
+# поверх одного фіксованого перемішування каталогу — тож за size надсилань
+# кожен елемент трапляється рівно один раз, а обчислення елемента не
+# залежить від розміру каталогу. Однакові елементи враховуються один раз
+# (за першою появою), а номери елементів — це номери у вихідній послідовності,
+# тож збережена за ними статистика не зсувається.
+class Catalog:
+    def __init__(self, items):
+        self.items = tuple(items)
+        first = {}
+        for index, item in enumerate(self.items):
+            first.setdefault(item, index)
+        self._indices = tuple(first.values())
+        size = len(self._indices)
+        self._steps = tuple(step for step in range(1, size + 1) if gcd(step, size) == 1)
+        self._order = tuple(random.Random(size).sample(range(size), size))
+
+    # Кількість різних елементів (довжина одного проходу)
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+    # Номер елемента (у вихідній послідовності) для position-го надсилання користувачу
+    def index(self, user_id, position):
+        size = len(self._indices)
+        cycle, offset = divmod(position, size)
+        seed = zlib.crc32(f"{user_id}:{cycle}".encode())
+        step = self._steps[seed % len(self._steps)]
+        shift = (seed >> 16) % size
+        return self._indices[self._order[(step * offset + shift) % size]]
+
+
+# Ротація контенту щоденної розсилки. Стан кожного користувача компактний:
+# лічильник надісланих підписів (users.caption_position) і кілька останніх
+# id зображень (users.recent_image_ids). Вибір підпису та зображення —
+# один запит до бази на надсилання.
+class ContentRotation:
+    def __init__(self, captions, recent_images=RECENT_IMAGES, persist=True):
+        self.captions = captions
+        self.recent_images = recent_images
+        self.persist = persist
+        self._memory = {}  # user_id -> [position, deque] (лише якщо persist=False)
+
+    async def init(self):
+        if not self.persist:
+            return
+        await db.execute('''
+            ALTER TABLE users
+                ADD COLUMN IF NOT EXISTS caption_position INTEGER NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS recent_image_ids BIGINT[] NOT NULL DEFAULT '{}'
+        ''')
+
+    # Наступний підпис і зображення для користувача.
+    # images — зображення розсилки [{"id", "url"}]; обирається те, якого
+    # користувач ще не бачив (або бачив найдавніше).
+    # Повертає (номер підпису, зображення).
+    async def next(self, user_id, images):
+        image_ids = [image["id"] for image in images if image["id"] is not None]
+        if self.persist:
+            position, image_id = await self._advance_db(user_id, image_ids)
+        else:
+            position, image_id = self._advance_memory(user_id, image_ids)
+
+        if image_id is not None:
+            image = next(image for image in images if image["id"] == image_id)
+        else:
+            image = random.choice(images)
+        return self.captions.index(user_id, position), image
+
+    async def _advance_db(self, user_id, image_ids):
+        row = await db.fetchrow('''
+            WITH current AS (
+                SELECT user_id, caption_position, recent_image_ids FROM users
+                WHERE user_id = $1
+                FOR UPDATE
+            ), pick AS (
+                SELECT c.id FROM current, unnest($2::bigint[]) AS c(id)
+                ORDER BY array_position(current.recent_image_ids, c.id) DESC NULLS FIRST, random()
+                LIMIT 1
+            )
+            UPDATE users AS u SET
+                caption_position = current.caption_position + 1,
+                recent_image_ids = CASE
+                    WHEN pick.id IS NULL THEN current.recent_image_ids
+                    ELSE (array_prepend(pick.id, array_remove(current.recent_image_ids, pick.id)))[1:$3]
+                END
+            FROM current LEFT JOIN pick ON true
+            WHERE u.user_id = current.user_id
+            RETURNING current.caption_position, pick.id
+        ''', user_id, image_ids, self.recent_images)
+        if row is None:
+            return 0, None
+        return row['caption_position'], row['id']
+
+    def _advance_memory(self, user_id, image_ids):
+        state = self._memory.get(user_id)
+        if state is None:
+            state = self._memory[user_id] = [0, deque(maxlen=self.recent_images)]
+        position, recent = state
+        state[0] += 1
+
+        image_id = None
+        unseen = [candidate for candidate in image_ids if candidate not in recent]
+        if unseen:
+            image_id = random.choice(unseen)
+        elif image_ids:
+            image_id = max(image_ids, key=recent.index)  # найдавніше показане
+        if image_id is not None:
+            if image_id in recent:
+                recent.remove(image_id)
+            recent.appendleft(image_id)
+        return position, image_id
@@ -0,0 +1,61 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+import auth
+from auth import AuthStates, TTLMemoryStorage
+
+
+def key(user_id):
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_storage_keeps_state_and_data():
+    async def main():
+        storage = TTLMemoryStorage()
+        await storage.set_state(key(1), AuthStates.waiting_for_password)
+        await storage.set_data(key(1), {"attempts": 2})
+        assert await storage.get_state(key(1)) == AuthStates.waiting_for_password.state
+        assert await storage.get_data(key(1)) == {"attempts": 2}
+        assert await storage.get_state(key(2)) is None
+        assert await storage.get_data(key(2)) == {}
+
+        # Порожній стан без даних видаляє запис
+        await storage.set_data(key(1), {})
+        await storage.set_state(key(1), None)
+        assert storage._records == {}
+
+    asyncio.run(main())
+
+
+def test_storage_expires_records():
+    async def main():
+        storage = TTLMemoryStorage(ttl=0.05)
+        await storage.set_state(key(1), AuthStates.waiting_for_password)
+        await asyncio.sleep(0.1)
+        assert await storage.get_state(key(1)) is None
+        assert await storage.get_data(key(1)) == {}
+
+    asyncio.run(main())
+
+
+def test_storage_evicts_oldest_records():
+    async def main():
+        storage = TTLMemoryStorage(max_records=3)
+        for user_id in range(5):
+            await storage.set_data(key(user_id), {"user_id": user_id})
+        assert len(storage._records) == 3
+        assert await storage.get_data(key(0)) == {}
+        assert await storage.get_data(key(4)) == {"user_id": 4}
+
+    asyncio.run(main())
+
+
+def test_lockout_after_max_attempts():
+    data = {}
+    for _ in range(auth.MAX_ATTEMPTS - 1):
+        data = auth.register_failure(data)
+        assert auth.lockout_remaining(data) == 0
+    data = auth.register_failure(data)
+    assert data["attempts"] == 0
+    assert auth.LOCKOUT - 1 <= auth.lockout_remaining(data) <= auth.LOCKOUT
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage
+
+import broadcast
+
+METHOD = SendMessage(chat_id=1, text="test")
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(broadcast, "BACKOFF_BASE", 0.001)
+
+
+# Розсилка без обмежень швидкості, із таймаутом на випадок зависання queue.join()
+def run_broadcast(recipients, send, **kwargs):
+    statuses = {}
+
+    async def on_result(chat_id, status):
+        assert chat_id not in statuses, f"повторний результат для {chat_id}"
+        statuses[chat_id] = status
+
+    async def main():
+        return await asyncio.wait_for(
+            broadcast.broadcast(
+                recipients,
+                send,
+                workers=4,
+                limiter=broadcast.TokenBucket(10000),
+                per_chat=broadcast.PerChatLimiter(0),
+                on_result=on_result,
+                **kwargs,
+            ),
+            timeout=5,
+        )
+
+    return asyncio.run(main()), statuses
+
+
+def test_sends_to_every_recipient_once():
+    sent = []
+
+    async def send(chat_id):
+        sent.append(chat_id)
+
+    result, statuses = run_broadcast(range(50), send)
+    assert sorted(sent) == list(range(50))
+    assert result.sent == 50 and result.total == 50
+    assert set(statuses.values()) == {"sent"}
+
+
+def test_accepts_async_recipients():
+    async def recipients():
+        for chat_id in range(10):
+            yield chat_id
+
+    async def send(chat_id):
+        pass
+
+    result, _ = run_broadcast(recipients(), send)
+    assert result.sent == 10
+
+
+def test_retry_after_requeues_recipient():
+    attempts = {}
+
+    async def send(chat_id):
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if chat_id == 3 and attempts[chat_id] < 3:
+            raise TelegramRetryAfter(METHOD, "flood", 0)
+
+    result, statuses = run_broadcast(range(5), send)
+    assert attempts[3] == 3
+    assert result.sent == 5
+    assert statuses[3] == "sent"
+
+
+def test_transient_errors_are_retried_then_reported_as_bot_errors():
+    attempts = {}
+
+    async def send(chat_id):
+        attempts[chat_id] = attempts.get(chat_id, 0) + 1
+        if chat_id == 1:
+            raise TelegramServerError(METHOD, "Internal Server Error")
+        if chat_id == 2 and attempts[chat_id] == 1:
+            raise ConnectionError("reset")
+
+    result, statuses = run_broadcast(range(3), send)
+    assert attempts[1] == broadcast.MAX_ATTEMPTS
+    assert attempts[2] == 2
+    assert statuses == {0: "sent", 1: "error", 2: "sent"}
+    assert (result.sent, result.error) == (2, 1)
+
+
+def test_classifies_errors():
+    async def send(chat_id):
+        if chat_id == 1:
+            raise TelegramForbiddenError(METHOD, "Forbidden: bot was blocked by the user")
+        if chat_id == 2:
+            raise TelegramBadRequest(METHOD, "Bad Request: chat not found")
+        if chat_id == 3:
+            raise TelegramBadRequest(METHOD, "Bad Request: not enough rights to send text messages")
+        if chat_id == 4:
+            raise TelegramBadRequest(METHOD, "Bad Request: message to copy not found")
+        if chat_id == 5:
+            raise RuntimeError("no images")
+
+    result, statuses = run_broadcast(range(6), send)
+    assert statuses == {0: "sent", 1: "blocked", 2: "blocked", 3: "failed", 4: "error", 5: "error"}
+    assert sorted(result.blocked_ids) == [1, 2]
+    assert (result.sent, result.blocked, result.failed, result.error) == (1, 2, 1, 2)
+
+
+def test_token_bucket_limits_rate():
+    async def main():
+        bucket = broadcast.TokenBucket(100, capacity=1)
+        started = time.monotonic()
+        for _ in range(11):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_token_bucket_pause():
+    async def main():
+        bucket = broadcast.TokenBucket(10000)
+        bucket.pause(0.05)
+        started = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started
+
+    assert asyncio.run(main()) >= 0.045
+
+
+def test_chained_limiter_pauses_every_limiter():
+    first, second = broadcast.TokenBucket(10), broadcast.TokenBucket(10)
+    broadcast.ChainedLimiter(first, second).pause(5)
+    assert first._paused_until > time.monotonic() + 4
+    assert second._paused_until > time.monotonic() + 4
@@ -0,0 +1,111 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from images import ImagePool
+
+
+# Фейковий Pixabay: сторінки з page_size зображень, сусідні сторінки
+# частково перетинаються, щоб перевірити відсіювання повторів
+def pixabay_app(total_hits, page_size, requests):
+    async def handle(request):
+        page = int(request.query["page"])
+        requests.append(page)
+        start = (page - 1) * page_size // 2
+        hits = [{"id": image_id, "webformatURL": f"https://example.com/{image_id}.jpg"}
+                for image_id in range(start, start + page_size)]
+        return web.json_response({"totalHits": total_hits, "hits": hits})
+
+    app = web.Application()
+    app.router.add_get("/api/", handle)
+    return app
+
+
+async def start_pool(requests, ttl=60, total_hits=40, page_size=10, low_water=0):
+    server = TestServer(pixabay_app(total_hits, page_size, requests))
+    await server.start_server()
+    pool = ImagePool("key", page_size=page_size, low_water=low_water, ttl=ttl, api_url=str(server.make_url("/api/")))
+    return server, pool
+
+
+def test_refill_skips_images_already_in_pool():
+    requests = []
+
+    async def main():
+        server, pool = await start_pool(requests)
+        try:
+            await pool.start(["cats"])
+            await pool.refill("cats")
+            return pool.size("cats")
+        finally:
+            await pool.close()
+            await server.close()
+
+    # Сторінки 1 і 2 мають 5 спільних зображень
+    assert asyncio.run(main()) == 15
+    assert requests == [1, 2]
+
+
+def test_next_page_wraps_after_last_page():
+    requests = []
+
+    async def main():
+        server, pool = await start_pool(requests, total_hits=20)
+        try:
+            await pool.start()
+            for _ in range(3):
+                await pool.refill("cats")
+        finally:
+            await pool.close()
+            await server.close()
+
+    asyncio.run(main())
+    assert requests == [1, 2, 1]
+
+
+def test_draw_without_repeats_and_expiry():
+    requests = []
+
+    async def main():
+        server, pool = await start_pool(requests, ttl=0.1)
+        try:
+            await pool.start(["cats"])
+            drawn = [pool.draw("cats")["id"] for _ in range(10)]
+            assert sorted(drawn) == list(range(10))
+            # Пул порожній — видаються вже показані зображення
+            assert pool.draw("cats")["id"] in drawn
+
+            await pool.refill("cats")
+            assert pool.size("cats") == 10
+            await asyncio.sleep(0.15)
+            assert pool.size("cats") == 0
+        finally:
+            await pool.close()
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_draw_schedules_refill_below_low_water():
+    requests = []
+
+    async def main():
+        server, pool = await start_pool(requests, low_water=5)
+        try:
+            await pool.start(["cats"])
+            for _ in range(6):
+                pool.draw("cats")
+            await asyncio.gather(*pool._refills.values())
+            return pool.size("cats")
+        finally:
+            await pool.close()
+            await server.close()
+
+    # Після 6 видач у пулі лишилося 4 зображення, тож завантажено ще одну сторінку
+    assert asyncio.run(main()) > 4
+    assert requests == [1, 2]
+
+
+def test_draw_from_empty_pool_returns_none():
+    assert ImagePool("key").draw("cats") is None
@@ -0,0 +1,88 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendPhoto
+from aiogram.types import BufferedInputFile
+
+from media import MediaCache
+
+
+# Бот, що запам'ятовує надіслані фото і видає новий file_id для кожного завантаження
+class FakeBot:
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.sent = []
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        await asyncio.sleep(0)
+        if photo in self.rejected:
+            raise TelegramBadRequest(SendPhoto(chat_id=chat_id, photo=photo), "wrong file identifier")
+        self.sent.append((chat_id, photo))
+        file_id = f"file-{len(self.sent)}" if isinstance(photo, BufferedInputFile) else photo
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+def make_cache(capacity=10):
+    cache = MediaCache(capacity=capacity, persist=False)
+    downloads = []
+
+    async def download(source_url):
+        downloads.append(source_url)
+        return b"image"
+
+    cache._download = download
+    return cache, downloads
+
+
+def test_upload_once_then_reuse_file_id():
+    bot = FakeBot()
+    cache, downloads = make_cache()
+
+    async def main():
+        for chat_id in range(3):
+            await cache.send_photo(bot, chat_id, "https://example.com/a.jpg", caption="test")
+
+    asyncio.run(main())
+    assert downloads == ["https://example.com/a.jpg"]
+    assert [photo for _, photo in bot.sent[1:]] == ["file-1", "file-1"]
+    assert cache.stats() == {"hits": 2, "misses": 1, "uploads": 1, "size": 1}
+
+
+def test_concurrent_sends_upload_once():
+    bot = FakeBot()
+    cache, downloads = make_cache()
+
+    async def main():
+        await asyncio.gather(*(cache.send_photo(bot, chat_id, "https://example.com/a.jpg") for chat_id in range(10)))
+
+    asyncio.run(main())
+    assert len(downloads) == 1
+    assert cache.uploads == 1 and cache.hits == 9
+
+
+def test_least_recently_used_is_evicted():
+    cache, _ = make_cache(capacity=2)
+
+    async def main():
+        await cache.put("a", "file-a")
+        await cache.put("b", "file-b")
+        cache.get("a")
+        await cache.put("c", "file-c")
+
+    asyncio.run(main())
+    assert cache.get("b") is None
+    assert cache.get("a") == "file-a" and cache.get("c") == "file-c"
+
+
+def test_rejected_file_id_is_uploaded_again():
+    bot = FakeBot(rejected={"stale"})
+    cache, downloads = make_cache()
+
+    async def main():
+        await cache.put("https://example.com/a.jpg", "stale")
+        await cache.send_photo(bot, 1, "https://example.com/a.jpg")
+
+    asyncio.run(main())
+    assert downloads == ["https://example.com/a.jpg"]
+    assert cache.get("https://example.com/a.jpg") == "file-1"
@@ -0,0 +1,57 @@
+import pytest
+
+from metrics import Counter, Histogram
+
+
+def test_quantile_returns_bucket_upper_bound():
+    histogram = Histogram("test_seconds", "test", buckets=(0.1, 0.5, 1.0))
+    for value in [0.05] * 50 + [0.3] * 40 + [0.8] * 9 + [5.0]:
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.9) == 0.5
+    assert histogram.quantile(0.99) == 1.0
+    assert histogram.quantile(1.0) == float("inf")
+    assert histogram.count() == 100
+    assert histogram.mean() == pytest.approx((0.05 * 50 + 0.3 * 40 + 0.8 * 9 + 5.0) / 100)
+
+
+def test_quantile_by_labels_and_empty():
+    histogram = Histogram("test_seconds", "test", buckets=(0.1, 1.0))
+    assert histogram.quantile(0.99) == 0.0
+    histogram.observe(0.05, method="a")
+    histogram.observe(0.5, method="b")
+    assert histogram.quantile(0.99, method="a") == 0.1
+    assert histogram.quantile(0.99, method="b") == 1.0
+    assert histogram.quantile(0.99, method="c") == 0.0
+    assert histogram.count() == 2
+
+
+def test_histogram_render_is_cumulative():
+    histogram = Histogram("test_seconds", "Тест", buckets=(0.1, 1.0))
+    histogram.observe(0.1, method="send")  # межа кошика належить йому (le)
+    histogram.observe(0.5, method="send")
+    histogram.observe(2.0, method="send")
+    assert histogram.render() == [
+        "# HELP test_seconds Тест",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{method="send",le="0.1"} 1',
+        'test_seconds_bucket{method="send",le="1.0"} 2',
+        'test_seconds_bucket{method="send",le="+Inf"} 3',
+        'test_seconds_sum{method="send"} 2.6',
+        'test_seconds_count{method="send"} 3',
+    ]
+
+
+def test_counter_values_and_render():
+    counter = Counter("test_total", "Тест")
+    counter.inc(status="sent")
+    counter.inc(2, status="sent")
+    counter.inc(status="blocked")
+    assert counter.value(status="sent") == 3
+    assert counter.value() == 4
+    assert counter.render() == [
+        "# HELP test_total Тест",
+        "# TYPE test_total counter",
+        'test_total{status="sent"} 3',
+        'test_total{status="blocked"} 1',
+    ]
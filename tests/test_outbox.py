@@ -0,0 +1,284 @@
+import asyncio
+
+import pytest
+
+import broadcast
+import outbox as outbox_module
+from outbox import CANCELLED, DONE, RUNNING, Outbox, SQLiteOutboxStore
+
+
+@pytest.fixture(autouse=True)
+def no_per_chat_limit(monkeypatch):
+    monkeypatch.setattr(broadcast, "chat_limiter", broadcast.PerChatLimiter(0))
+
+
+# Черга розсилок на SQLite з типом "test", що записує отримувачів у sent.
+# Після block_after надсилань наступні зависають, доки їх не скасують.
+def make_outbox(path, sent, block_after=None, batch_size=10, on_checkpoint=None, owner=None):
+    outbox = Outbox(SQLiteOutboxStore(path), batch_size=batch_size, on_checkpoint=on_checkpoint, owner=owner)
+
+    def make_send(payload):
+        async def send(chat_id):
+            if block_after is not None and len(sent) >= block_after:
+                await asyncio.Event().wait()
+            sent.append(chat_id)
+        return send
+
+    outbox.register("test", make_send, limiter=broadcast.TokenBucket(10000))
+    return outbox
+
+
+async def wait_until(condition, timeout=5):
+    async with asyncio.timeout(timeout):
+        while not condition():
+            await asyncio.sleep(0.01)
+
+
+def test_send_checkpoints_every_recipient(tmp_path):
+    sent, checkpoints = [], []
+
+    async def on_checkpoint(results):
+        checkpoints.append(results)
+
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", sent, batch_size=7, on_checkpoint=on_checkpoint)
+        await outbox.init()
+        result = await outbox.send("test", {}, range(25))
+        broadcast_id = (await outbox.store.recent(1))[0]['id']
+        status = await outbox.store.get_status(broadcast_id)
+        progress = await outbox.store.progress(broadcast_id)
+        await outbox.close()
+        return result, status, progress
+
+    result, status, progress = asyncio.run(main())
+    assert sorted(sent) == list(range(25))
+    assert result.sent == 25 and not result.cancelled
+    assert status == DONE
+    assert progress == {"sent": 25}
+    assert sorted(user_id for batch in checkpoints for user_id, _ in batch) == list(range(25))
+    assert all(len(batch) <= 7 for batch in checkpoints)
+
+
+def test_cancel_stops_broadcast_and_keeps_partial_result(tmp_path):
+    sent = []
+
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", sent, block_after=5)
+        await outbox.init()
+        broadcast_id = await outbox.submit("test", {}, range(100))
+        run = asyncio.create_task(outbox.run(broadcast_id, "test", {}))
+        await wait_until(lambda: len(sent) >= 5)
+        assert await outbox.cancel(broadcast_id)
+        result = await run
+        assert not await outbox.cancel(broadcast_id)  # уже скасована
+        status = await outbox.store.get_status(broadcast_id)
+        progress = await outbox.store.progress(broadcast_id)
+        await outbox.close()
+        return result, status, progress
+
+    result, status, progress = asyncio.run(main())
+    assert result.cancelled
+    assert status == CANCELLED
+    assert result.sent == len(sent) == 5
+    # Перервані надсилання позначені як невідомі, решта чекає
+    assert progress["sent"] == 5 and progress["unknown"] > 0
+    assert progress["sent"] + progress["unknown"] + progress["pending"] == 100
+
+
+def test_cancel_from_store_stops_next_batch(tmp_path):
+    sent = []
+
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", sent, batch_size=5)
+        await outbox.init()
+        broadcast_id = await outbox.submit("test", {}, range(50))
+        # Скасування в іншому процесі: змінюється лише статус у сховищі
+        await outbox.store.cancel(broadcast_id)
+        result = await outbox.run(broadcast_id, "test", {})
+        await outbox.close()
+        return result
+
+    result = asyncio.run(main())
+    assert result.cancelled
+    assert sent == []
+
+
+def test_resume_continues_after_shutdown(tmp_path):
+    sent = []
+    path = tmp_path / "outbox.db"
+
+    async def first_run():
+        outbox = make_outbox(path, sent, block_after=10)
+        await outbox.init()
+        broadcast_id = await outbox.submit("test", {}, range(60))
+        run = asyncio.create_task(outbox.run(broadcast_id, "test", {}))
+        await wait_until(lambda: len(sent) >= 10)
+        await outbox.close()  # зупинка бота: розсилка переривається, прогрес зберігається
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        return broadcast_id
+
+    async def second_run(broadcast_id):
+        outbox = make_outbox(path, sent)
+        await outbox.init()
+        assert await outbox.store.get_status(broadcast_id) == RUNNING
+        await outbox.resume()
+        await asyncio.gather(*outbox._tasks.values())
+        status = await outbox.store.get_status(broadcast_id)
+        progress = await outbox.store.progress(broadcast_id)
+        await outbox.close()
+        return status, progress
+
+    broadcast_id = asyncio.run(first_run())
+    assert len(sent) == 10
+    status, progress = asyncio.run(second_run(broadcast_id))
+    assert status == DONE
+    # Надіслані до зупинки отримувачі не отримують повідомлення вдруге, а
+    # тим, чиє надсилання перервала зупинка, воно не повторюється
+    assert len(set(sent)) == len(sent)
+    assert progress["sent"] + progress.get("unknown", 0) == 60
+    assert progress["sent"] == len(sent)
+
+
+def test_resume_abandons_unprepared_broadcast(tmp_path):
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", [])
+        await outbox.init()
+        broadcast_id = await outbox.store.create("test", "{}")
+        await outbox.resume()
+        status = await outbox.store.get_status(broadcast_id)
+        await outbox.close()
+        return status
+
+    assert asyncio.run(main()) == outbox_module.ABANDONED
+
+
+def test_crash_during_send_is_not_repeated(tmp_path):
+    sent = []
+
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", sent)
+        await outbox.init()
+        broadcast_id = await outbox.submit("test", {}, range(20))
+        # Збій після початку надсилання, до збереження результатів
+        for user_id in range(5):
+            await outbox.store.mark_sending(broadcast_id, user_id)
+        await outbox.store.checkpoint(broadcast_id, [(0, "sent")])
+        result = await outbox.run(broadcast_id, "test", {})
+        progress = await outbox.store.progress(broadcast_id)
+        await outbox.close()
+        return result, progress
+
+    result, progress = asyncio.run(main())
+    assert sorted(sent) == list(range(5, 20))
+    assert result.sent == 15
+    assert progress == {"sent": 16, "unknown": 4}
+
+
+# Імітація зупиненої репліки: оренда всіх розсилок спливла
+async def expire_leases(outbox):
+    await outbox.store._run(
+        outbox.store._execute, "UPDATE broadcasts SET lease_until = datetime('now', '-1 seconds')", ()
+    )
+
+
+def test_takeover_only_claims_expired_leases(tmp_path):
+    sent = []
+    path = tmp_path / "outbox.db"
+
+    async def main():
+        first = make_outbox(path, [], owner="a")
+        second = make_outbox(path, sent, owner="b")
+        await first.init()
+        await second.init()
+        broadcast_id = await first.submit("test", {}, range(30))
+        await second.resume(takeover_only=True)
+        assert second._tasks == {}  # оренда ще дійсна
+        await expire_leases(first)
+        await second.resume(takeover_only=True)
+        await asyncio.gather(*second._tasks.values())
+        status = await second.store.get_status(broadcast_id)
+        await first.close()
+        await second.close()
+        return status
+
+    assert asyncio.run(main()) == DONE
+    assert sorted(sent) == list(range(30))
+
+
+def test_lost_lease_stops_sending_without_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "LEASE_RENEW_INTERVAL", 0.05)
+    sent = []
+    path = tmp_path / "outbox.db"
+
+    async def main():
+        first = make_outbox(path, sent, block_after=5, owner="a")
+        second = make_outbox(path, sent, owner="b")
+        await first.init()
+        await second.init()
+        broadcast_id = await first.submit("test", {}, range(40))
+        run = asyncio.create_task(first.run(broadcast_id, "test", {}))
+        await wait_until(lambda: len(sent) >= 5)
+        await expire_leases(first)
+        rows = await second.store.unfinished("b", own=False)
+        assert [row['id'] for row in rows] == [broadcast_id]
+        with pytest.raises(RuntimeError):
+            await run
+        result = await second.run(broadcast_id, "test", {})
+        # Отримувача, якого вже позначено, інша репліка не надсилає вдруге
+        assert not await first.store.mark_sending(broadcast_id, 0)
+        progress = await second.store.progress(broadcast_id)
+        await first.close()
+        await second.close()
+        return result, progress
+
+    result, progress = asyncio.run(main())
+    assert len(set(sent)) == len(sent)
+    assert progress["sent"] == len(sent)
+    assert progress["sent"] + progress.get("unknown", 0) == 40
+    assert result.sent == len(sent) - 5
+
+
+def test_start_runs_in_background(tmp_path):
+    sent = []
+
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", sent)
+        await outbox.init()
+        broadcast_id = await outbox.start("test", {}, range(15))
+        await asyncio.gather(*outbox._tasks.values())
+        status = await outbox.store.get_status(broadcast_id)
+        await outbox.close()
+        return status
+
+    assert asyncio.run(main()) == DONE
+    assert sorted(sent) == list(range(15))
+
+
+def test_prune_removes_only_old_finished_broadcasts(tmp_path):
+    async def main():
+        outbox = make_outbox(tmp_path / "outbox.db", [])
+        await outbox.init()
+        old = await outbox.submit("test", {}, range(3))
+        await outbox.run(old, "test", {})
+        recent = await outbox.submit("test", {}, range(3))
+        await outbox.run(recent, "test", {})
+        running = await outbox.submit("test", {}, range(3))
+        await outbox.store._run(
+            outbox.store._execute,
+            "UPDATE broadcasts SET created_at = datetime('now', '-60 days'), "
+            "finished_at = CASE WHEN status = 'done' THEN datetime('now', '-60 days') END WHERE id IN (?, ?)",
+            (old, running),
+        )
+        deleted = await outbox.prune(days=30)
+        remaining = [row['id'] for row in await outbox.store.recent(10)]
+        deliveries = await outbox.store._run(
+            outbox.store._execute, 'SELECT DISTINCT broadcast_id FROM broadcast_deliveries ORDER BY broadcast_id'
+        )
+        await outbox.close()
+        return deleted, remaining, [row['broadcast_id'] for row in deliveries], (old, recent, running)
+
+    deleted, remaining, deliveries, (old, recent, running) = asyncio.run(main())
+    assert deleted == 1
+    assert remaining == [running, recent]
+    assert deliveries == [recent, running]
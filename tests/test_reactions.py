@@ -0,0 +1,22 @@
+from reactions import LIKE, NEW_PHOTO, _rollup
+
+
+def test_rollup_counts_likes_and_refreshes_per_image_and_caption():
+    events = [
+        (1, LIKE, 10, 3, None),
+        (2, LIKE, 10, 4, None),
+        (1, NEW_PHOTO, 11, 3, None),
+        (3, "unknown", 10, 3, None),  # інші події у зведену таблицю не потрапляють
+    ]
+    assert sorted(_rollup(events)) == [
+        ("caption", 3, 1, 1),
+        ("caption", 4, 1, 0),
+        ("image", 10, 2, 0),
+        ("image", 11, 0, 1),
+    ]
+
+
+def test_rollup_skips_missing_keys():
+    events = [(1, LIKE, None, 5, None), (2, NEW_PHOTO, 7, None, None)]
+    assert sorted(_rollup(events)) == [("caption", 5, 1, 0), ("image", 7, 0, 1)]
+    assert _rollup([]) == []
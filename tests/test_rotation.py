@@ -0,0 +1,45 @@
+import asyncio
+
+from rotation import Catalog, ContentRotation
+
+
+def test_catalog_covers_every_item_once_per_pass():
+    catalog = Catalog(f"підпис {i}" for i in range(50))
+    for user_id in (1, 42, 10 ** 12):
+        for cycle in range(3):
+            indices = [catalog.index(user_id, cycle * 50 + offset) for offset in range(50)]
+            assert sorted(indices) == list(range(50))
+
+
+def test_catalog_dedupes_to_original_indices():
+    items = ["a", "b", "a", "c", "b", "d"]
+    catalog = Catalog(items)
+    assert len(catalog) == 4
+    indices = [catalog.index(7, position) for position in range(4)]
+    # Кожен різний елемент один раз, за номером його першої появи
+    assert sorted(indices) == [0, 1, 3, 5]
+    assert sorted(catalog[index] for index in indices) == ["a", "b", "c", "d"]
+
+
+def test_catalog_is_deterministic_and_differs_between_users():
+    items = range(100)
+    first, second = Catalog(items), Catalog(items)
+    order = [first.index(1, position) for position in range(100)]
+    assert order == [second.index(1, position) for position in range(100)]
+    assert order != [first.index(2, position) for position in range(100)]
+
+
+def test_rotation_without_persistence():
+    captions = Catalog(f"підпис {i}" for i in range(10))
+    rotation = ContentRotation(captions, recent_images=5, persist=False)
+    images = [{"id": image_id, "url": f"https://example.com/{image_id}.jpg"} for image_id in range(5)]
+
+    async def main():
+        return [await rotation.next(1, images) for _ in range(10)]
+
+    picks = asyncio.run(main())
+    assert sorted(caption_id for caption_id, _ in picks) == list(range(10))
+    # Спершу обираються ще не бачені зображення, потім — найдавніше показані
+    image_ids = [image["id"] for _, image in picks]
+    assert sorted(image_ids[:5]) == list(range(5))
+    assert image_ids[5:] == image_ids[:5]
@@ -0,0 +1,65 @@
+import pytest
+
+import users_io
+
+
+def test_parse_csv_with_header():
+    data = "user_id,username,first_name\n1,alice,Alice\n\n2,,Bob\n".encode("utf-8-sig")
+    rows = users_io.parse(data, "users.csv")
+    assert [(row.line, row.user_id, row.username, row.first_name) for row in rows] == [
+        (2, 1, "alice", "Alice"),
+        (4, 2, None, "Bob"),
+    ]
+    assert all(row.status is None for row in rows)
+
+
+def test_parse_csv_without_header():
+    rows = users_io.parse(b"10\n 20 \n")
+    assert [row.user_id for row in rows] == [10, 20]
+
+
+def test_parse_json():
+    rows = users_io.parse(b'[1, "2", {"user_id": 3, "username": "carol"}]', "users.json")
+    assert [row.user_id for row in rows] == [1, 2, 3]
+    assert rows[2].username == "carol"
+
+
+@pytest.mark.parametrize("value", ["abc", "", "1.5", str(2 ** 63), str(-2 ** 63 - 1)])
+def test_parse_marks_invalid_user_id(value):
+    rows = users_io.parse(f"user_id\n{value}\n".encode())
+    if not value:
+        assert rows == []  # порожні рядки пропускаються
+        return
+    assert rows[0].status == users_io.INVALID
+    assert value in rows[0].detail
+
+
+def test_parse_accepts_bigint_bounds():
+    rows = users_io.parse(f"{2 ** 63 - 1}\n{-2 ** 63}\n".encode())
+    assert [row.status for row in rows] == [None, None]
+
+
+@pytest.mark.parametrize("data", [b"null", b"42", b'"abc"', b'{"user_id": 1}'])
+def test_parse_rejects_json_that_is_not_a_list(data):
+    with pytest.raises(ValueError):
+        users_io.parse(data, "users.json")
+
+
+def test_parse_json_validates_text_fields():
+    rows = users_io.parse(
+        b'[{"user_id": 1, "username": 123, "first_name": null},'
+        b' {"user_id": 2, "username": ["x"]},'
+        b' {"user_id": 3, "first_name": {"a": 1}},'
+        b' {"user_id": 4, "username": true}]',
+        "users.json",
+    )
+    assert (rows[0].status, rows[0].username, rows[0].first_name) == (None, "123", None)
+    assert [row.status for row in rows[1:]] == [users_io.INVALID] * 3
+    assert "username" in rows[1].detail and "first_name" in rows[2].detail
+
+
+def test_parse_rejects_too_many_rows(monkeypatch):
+    monkeypatch.setattr(users_io, "MAX_ROWS", 3)
+    assert len(users_io.parse(b"1\n2\n3\n")) == 3
+    with pytest.raises(ValueError):
+        users_io.parse(b"1\n2\n3\n4\n")
@@ -0,0 +1,81 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+import webhook
+
+SECRET = "test-secret"
+
+# Оновлення в тому вигляді, в якому його надсилає Telegram
+UPDATE = {
+    "update_id": 1001,
+    "message": {
+        "message_id": 7,
+        "date": 1700000000,
+        "chat": {"id": 42, "type": "private", "first_name": "Test"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Test"},
+        "text": "привіт",
+    },
+}
+
+
+def run_client(test):
+    dispatcher = Dispatcher()
+    bot = Bot("123456:TEST")
+    received = []
+    drained = asyncio.Event()
+
+    @dispatcher.message()
+    async def handler(message):
+        await asyncio.sleep(0.05)
+        received.append(message.text)
+
+    @dispatcher.shutdown()
+    async def on_shutdown(drain_updates=None):
+        await drain_updates(1)
+        drained.set()
+
+    async def main():
+        app = webhook.create_app(dispatcher, bot, "/webhook", secret=SECRET)
+        async with TestClient(TestServer(app)) as client:
+            await test(client)
+        assert drained.is_set()
+        return received
+
+    return asyncio.run(main())
+
+
+def test_update_requires_secret():
+    async def test(client):
+        response = await client.post("/webhook", json=UPDATE)
+        assert response.status == 401
+        response = await client.post(
+            "/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}
+        )
+        assert response.status == 401
+
+    assert run_client(test) == []
+
+
+def test_update_is_handled_before_shutdown():
+    async def test(client):
+        response = await client.post(
+            "/webhook", json=UPDATE, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+        )
+        assert response.status == 200
+
+    # Обробник ще працює, коли сервер зупиняється, — зупинка його дочікується
+    assert run_client(test) == ["привіт"]
+
+
+def test_health_and_metrics():
+    async def test(client):
+        response = await client.get("/health")
+        assert response.status == 200
+        assert (await response.json())["status"] == "ok"
+        response = await client.get("/metrics")
+        assert response.status == 200
+        assert "# TYPE" in await response.text()
+
+    run_client(test)
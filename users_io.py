@@ -0,0 +1,223 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import broadcast
+import db
+
+# Параметри масового імпорту
+MAX_FILE_SIZE = 5 * 1024 * 1024  # байт
+MAX_ROWS = 20000
+RESOLVE_RATE = 20  # запитів get_chat на секунду
+RESOLVE_CONCURRENCY = 10
+RESOLVE_ATTEMPTS = 3
+EXPORT_FIELDS = ("user_id", "username", "first_name")
+BIGINT_MIN, BIGINT_MAX = -2 ** 63, 2 ** 63 - 1  # межі колонки users.user_id
+
+# Статуси рядків імпорту
+ADDED = "added"
+EXISTS = "exists"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+NOT_FOUND = "not_found"
+
+
+# Рядок файлу імпорту та його результат
+class ImportRow:
+    def __init__(self, line, user_id=None, username=None, first_name=None, status=None, detail=""):
+        self.line = line
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.status = status
+        self.detail = detail
+
+
+# Розбір CSV (з заголовком user_id,username,first_name або лише з колонкою
+# user_id) чи JSON (список user_id або об'єктів з такими ж полями)
+def parse(data, filename=""):
+    text = data.decode("utf-8-sig")
+    if filename.lower().endswith(".json") or text.lstrip().startswith("["):
+        records = json.loads(text)
+        if not isinstance(records, list):
+            raise ValueError("JSON має містити список користувачів")
+        records = enumerate(records, start=1)
+    else:
+        records = _csv_records(text)
+
+    rows = []
+    for line, record in records:
+        if not isinstance(record, dict):
+            record = {"user_id": record}
+        row = ImportRow(line)
+        try:
+            row.user_id = int(str(record.get("user_id", "")).strip())
+            if not BIGINT_MIN <= row.user_id <= BIGINT_MAX:
+                raise ValueError
+        except ValueError:
+            row.status, row.detail = INVALID, f"некоректний user_id: {record.get('user_id')!r}"
+        for field in ("username", "first_name"):
+            try:
+                setattr(row, field, _text(record.get(field)))
+            except ValueError:
+                if not row.status:
+                    row.status, row.detail = INVALID, f"некоректне поле {field}: {record.get(field)!r}"
+        rows.append(row)
+        if len(rows) > MAX_ROWS:
+            raise ValueError(f"забагато рядків (максимум {MAX_ROWS})")
+    return rows
+
+
+# Текстове поле з файлу: рядок, число (перетворюється на рядок) або
+# порожнє значення (None). Інші типи (списки, об'єкти, true/false) — ValueError.
+def _text(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise ValueError(value)
+
+
+def _csv_records(text):
+    reader = csv.reader(io.StringIO(text))
+    header = None
+    for line, values in enumerate(reader, start=1):
+        if not values or not "".join(values).strip():
+            continue
+        if header is None:
+            header = [value.strip().lower() for value in values]
+            if "user_id" in header:
+                continue
+            header = list(EXPORT_FIELDS)
+        yield line, dict(zip(header, (value.strip() for value in values)))
+
+
+# Масовий імпорт: існуючі та повторні user_id відсіюються одним запитом,
+# нові користувачі перевіряються через get_chat паралельно з обмеженням
+# швидкості, а знайдені записуються через COPY в одній транзакції.
+# Результат кожного рядка записується в row.status; повертає список доданих user_id.
+async def import_users(bot, rows):
+    seen = set()
+    candidates = []
+    for row in rows:
+        if row.status:
+            continue
+        if row.user_id in seen:
+            row.status = DUPLICATE
+            continue
+        seen.add(row.user_id)
+        candidates.append(row)
+
+    existing = await db.fetch('SELECT user_id FROM users WHERE user_id = ANY($1::bigint[])', list(seen))
+    existing = {record['user_id'] for record in existing}
+    for row in candidates:
+        if row.user_id in existing:
+            row.status = EXISTS
+    candidates = [row for row in candidates if not row.status]
+
+    await _resolve(bot, candidates)
+    found = [row for row in candidates if not row.status]
+
+    added = []
+    if found:
+        async with db.transaction() as conn:
+            await conn.execute('''
+                CREATE TEMP TABLE users_import (user_id BIGINT, username TEXT, first_name TEXT) ON COMMIT DROP
+            ''')
+            await conn.copy_records_to_table(
+                'users_import',
+                records=[(row.user_id, row.username, row.first_name) for row in found],
+                columns=EXPORT_FIELDS,
+            )
+            inserted = await conn.fetch('''
+                INSERT INTO users (user_id, username, first_name)
+                SELECT user_id, username, first_name FROM users_import
+                ON CONFLICT (user_id) DO NOTHING
+                RETURNING user_id
+            ''')
+        added = [record['user_id'] for record in inserted]
+
+    added_set = set(added)
+    for row in found:
+        row.status = ADDED if row.user_id in added_set else EXISTS
+    logging.info(f"📥 Імпорт користувачів: {len(rows)} рядків, додано {len(added)}.")
+    return added
+
+
+# Перевірка користувачів через get_chat (ім'я та нікнейм з Telegram мають
+# пріоритет над даними з файлу)
+async def _resolve(bot, rows):
+    limiter = broadcast.TokenBucket(RESOLVE_RATE)
+    semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+    async def resolve(row):
+        async with semaphore:
+            for attempt in range(RESOLVE_ATTEMPTS):
+                await limiter.acquire()
+                try:
+                    chat = await bot.get_chat(row.user_id)
+                except TelegramRetryAfter as e:
+                    limiter.pause(e.retry_after)
+                    continue
+                except Exception as e:
+                    row.status, row.detail = NOT_FOUND, str(e)
+                    return
+                row.username = chat.username or row.username or "немає"
+                row.first_name = chat.first_name or row.first_name or "немає"
+                return
+            row.status, row.detail = NOT_FOUND, "перевищено ліміт запитів Telegram"
+
+    await asyncio.gather(*(resolve(row) for row in rows))
+
+
+# Підсумок імпорту: кількість рядків за статусами
+def summary(rows):
+    counts = {}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+    return (
+        f"📥 Рядків: {len(rows)}\n"
+        f"✅ Додано: {counts.get(ADDED, 0)}\n"
+        f"↩️ Вже існують: {counts.get(EXISTS, 0)}\n"
+        f"🔁 Повтори у файлі: {counts.get(DUPLICATE, 0)}\n"
+        f"❓ Не знайдено в Telegram: {counts.get(NOT_FOUND, 0)}\n"
+        f"⚠️ Некоректні рядки: {counts.get(INVALID, 0)}"
+    )
+
+
+# Звіт по кожному рядку у форматі CSV
+def report(rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(("line", "user_id", "status", "detail"))
+    for row in rows:
+        writer.writerow((row.line, row.user_id, row.status, row.detail))
+    return output.getvalue().encode("utf-8")
+
+
+# Експорт таблиці users у CSV-файл. Користувачі читаються пакетами і
+# одразу пишуться на диск, тож пам'ять не залежить від розміру таблиці.
+# Повертає шлях до тимчасового файлу (його слід видалити після надсилання).
+async def export_users():
+    handle, path = tempfile.mkstemp(prefix="users_", suffix=".csv")
+    count = 0
+    try:
+        with os.fdopen(handle, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_FIELDS)
+            async for user in db.iter_users():
+                writer.writerow([user[field] for field in EXPORT_FIELDS])
+                count += 1
+    except Exception:
+        os.remove(path)
+        raise
+    logging.info(f"📤 Експортовано {count} користувачів.")
+    return path, count
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import metrics
+
+CONNECTIONS_TIMEOUT = 2  # секунд на закриття HTTP-з'єднань (оновлення обробляються у фоні)
+HEALTH_PATH = "/health"
+METRICS_PATH = "/metrics"
+
+
+# Обробник вебхука з керованою зупинкою. Обробка вже отриманих оновлень
+# дочікується через drain(), який викликає зупинка бота разом з іншими
+# сервісами в межах спільного терміну, а сесія бота закривається останньою —
+# на етапі on_cleanup, після зупинки диспетчера.
+class DrainingRequestHandler(SimpleRequestHandler):
+    def register(self, app, /, path, **kwargs):
+        app.router.add_route("POST", path, self.handle, **kwargs)
+        app.on_cleanup.append(self._handle_close)
+
+    async def drain(self, timeout):
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        logging.info(f"⏳ Очікую завершення {len(tasks)} обробників...")
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def health_handler(request):
+    return web.json_response({"status": "ok", "pid": os.getpid()})
+
+
+# Створення aiohttp-застосунку для прийому оновлень від Telegram.
+# Для локальної перевірки достатньо надіслати POST-запит із JSON оновлення
+# на path із заголовком X-Telegram-Bot-Api-Secret-Token.
+def create_app(dispatcher, bot, path, secret=None, webhook_url=None, is_primary=True):
+    app = web.Application()
+    app.router.add_get(HEALTH_PATH, health_handler)
+    app.router.add_get(METRICS_PATH, metrics.metrics_handler)
+
+    # Зупинка диспетчера отримує drain_updates, щоб дочекатися обробників
+    # оновлень одночасно з розсилками
+    handler = DrainingRequestHandler(dispatcher=dispatcher, bot=bot, secret_token=secret)
+    handler.register(app, path=path)
+    setup_application(app, dispatcher, bot=bot, is_primary=is_primary, drain_updates=handler.drain)
+
+    # Вебхук реєструє лише основний процес, щоб не робити це з кожного
+    if webhook_url and is_primary:
+        async def set_webhook(app):
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=secret,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+            )
+            logging.info(f"🌐 Вебхук встановлено: {webhook_url}")
+
+        app.on_startup.append(set_webhook)
+    return app
+
+
+def _serve(dispatcher, bot, host, port, path, secret, webhook_url, index):
+    app = create_app(dispatcher, bot, path, secret, webhook_url, is_primary=index == 0)
+    logging.info(f"🚀 Процес {index} (pid {os.getpid()}) приймає вебхуки на {host}:{port}{path}")
+    # reuse_port дозволяє кільком процесам слухати один порт, ядро
+    # розподіляє з'єднання між ними
+    web.run_app(
+        app,
+        host=host,
+        port=port,
+        reuse_port=True,
+        shutdown_timeout=CONNECTIONS_TIMEOUT,
+        print=None,
+    )
+
+
+# Запуск бота в режимі вебхука в одному або кількох процесах.
+# Процеси не мають спільного стану в пам'яті, тому при workers > 1
+# стан автентифікації слід зберігати в Redis (REDIS_URL).
+def run(dispatcher, bot, host, port, path, secret=None, webhook_url=None, workers=1):
+    if workers <= 1:
+        _serve(dispatcher, bot, host, port, path, secret, webhook_url, 0)
+        return
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=_serve, args=(dispatcher, bot, host, port, path, secret, webhook_url, index))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()